@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import stat
+import socket
+import struct
+import getpass
+import hashlib
+import tempfile
+import threading
+
+# asyncio importeras först när agenten startar, klienten ska starta snabbt
+
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+
+
+def socket_dir():
+    """Private directory for the socket, created with mode 0700 if missing
+
+    $XDG_RUNTIME_DIR/joker when there is a runtime directory, otherwise
+    joker-<uid> in the temporary directory. A directory that is a symlink,
+    belongs to someone else or is open to others is refused, since whoever
+    controls it could put their own socket there.
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        path = os.path.join(runtime, "joker")
+    else:
+        user = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+        path = os.path.join(tempfile.gettempdir(), f"joker-{user}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    if not hasattr(os, "getuid"):
+        return path
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{path} is not a private directory of this user")
+    return path
+
+
+def vault_identity(vault_dir: str = None):
+    """The vault an agent serves, as the real path of its directory"""
+    return os.path.realpath(vault_dir or os.curdir)
+
+
+def default_socket_path(vault_dir: str = None):
+    """Per-user and per-vault socket path, JOKER_AGENT_SOCK overrides it"""
+    path = os.environ.get("JOKER_AGENT_SOCK")
+    if path:
+        return path
+    # Ett valv per socket, så två GUI:n med olika valv krockar inte
+    digest = hashlib.sha256(vault_identity(vault_dir).encode()).hexdigest()[:16]
+    return os.path.join(socket_dir(), f"agent-{digest}.sock")
+
+
+def peer_uid(sock):
+    """Uid of the process at the other end of a connected Unix socket"""
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+    # Utan SO_PEERCRED (macOS, BSD) får socketfilens ägare duga
+    return os.stat(sock.getpeername()).st_uid
+
+
+class UnlockAgent:
+    """Serve an unlocked PasswordManagerCore over a Unix domain socket
+
+    Clients send one JSON object per line and get one JSON object back, so
+    they reuse the derived key instead of running the KDF themselves. Core
+    calls run on the event loop thread, which keeps them serialized while
+    any number of clients are connected. A ping answers with the vault the
+    agent serves, so clients can tell it is theirs. After idle_timeout seconds
+    without a request the agent exits, and locks the core if it owns it.
+    """
+
+    def __init__(self, core, socket_path: str = None, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 lock_on_exit: bool = True):
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("The unlock agent needs Unix domain sockets")
+        if not core.initialized:
+            raise RuntimeError("Encryption system not initialized")
+        self.core = core
+        self.socket_path = socket_path or default_socket_path(core.vault_dir)
+        self._remove_stale_socket()
+        self.idle_timeout = idle_timeout
+        self.lock_on_exit = lock_on_exit
+        self._loop = None
+        self._stopped = None
+        self._last_request = 0
+
+    def _remove_stale_socket(self):
+        """Remove a socket left by an agent that died, refuse one that answers"""
+        if not os.path.exists(self.socket_path):
+            return
+        client = AgentClient(self.socket_path, timeout=1)
+        if client.connect():
+            client.close()
+            raise RuntimeError(f"An unlock agent is already listening on {self.socket_path}")
+        os.remove(self.socket_path)
+
+    def serve_forever(self):
+        import asyncio
+        asyncio.run(self._serve())
+
+    def stop(self):
+        """Stop the agent, safe to call from any thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def _serve(self):
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._last_request = self._loop.time()
+
+        # Bara ägaren får ansluta till socketen
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        finally:
+            os.umask(old_umask)
+
+        watchdog = asyncio.create_task(self._watch_idle())
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            watchdog.cancel()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            if self.lock_on_exit:
+                self.core.lock()
+
+    async def _watch_idle(self):
+        import asyncio
+        while True:
+            remaining = self._last_request + self.idle_timeout - self._loop.time()
+            if remaining <= 0:
+                self._stopped.set()
+                return
+            await asyncio.sleep(remaining)
+
+    async def _handle(self, reader, writer):
+        try:
+            # Socketen är 0600, med SO_PEERCRED kontrolleras klienten även direkt
+            if hasattr(socket, "SO_PEERCRED") and peer_uid(writer.get_extra_info("socket")) != os.getuid():
+                return
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._last_request = self._loop.time()
+                try:
+                    request = json.loads(line)
+                    response = {"ok": True, "result": self._dispatch(request)}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _dispatch(self, request: dict):
+        if request.get("op") == "lock":
+            self._stopped.set()
+            return None
+        if not self.core.key_is_current():
+            # Nyckeln är inaktuell efter ett lösenordsbyte, agenten måste låsas upp på nytt
+            self._stopped.set()
+            raise RuntimeError("The master password was changed, the agent has locked")
+        return dispatch(self.core, request)
+
+
+def dispatch(core, request: dict):
+    """Run one protocol request against an unlocked core"""
+    op = request.get("op")
+    if op == "ping":
+        return vault_identity(core.vault_dir)
+    if op == "list":
+        return [_public(entry) for entry in core.list_entries()]
+    if op == "get":
+        entry = core.get(request["id"])
+        return _public(entry) if entry is not None else None
+    if op == "find":
+        return [_public(entry) for entry in core.find(request.get("website"), request.get("username"))]
+    if op == "search":
+        return [_public(core.get(entry_id)) for entry_id in core.search(request["query"])]
+    if op == "reveal":
+        entry = core.get(request["id"])
+        if entry is None:
+            raise KeyError(request["id"])
+        return core.reveal_password(entry)
+    if op == "add":
+        return core.save_password_entry(request["entry"])
+    if op == "delete":
+        core.delete(request["id"])
+        return None
+    raise ValueError(f"Unknown operation: {op}")
+
+
+def _public(entry: dict):
+    # Krypterade lösenord lämnar aldrig agenten, bara via reveal i klartext
+    return {key: value for key, value in entry.items() if key != "password"}
+
+
+def start_agent_thread(core, socket_path: str = None, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+    """Share an already unlocked core from a process that keeps running
+
+    The agent runs on a daemon thread and leaves the core unlocked when it
+    times out, since the hosting process is still using it.
+    """
+    agent = UnlockAgent(core, socket_path, idle_timeout, lock_on_exit=False)
+    thread = threading.Thread(target=agent.serve_forever, name="unlock-agent", daemon=True)
+    thread.start()
+    return agent
+
+
+class AgentClient:
+    """Blocking client for a running UnlockAgent"""
+
+    def __init__(self, socket_path: str = None, timeout: float = 5, vault_dir: str = None):
+        self.socket_path = socket_path or default_socket_path(vault_dir)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+
+    def connect(self):
+        """Connect to the agent, returns False when none is running"""
+        if not hasattr(socket, "AF_UNIX"):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            return False
+        if peer_uid(sock) != os.getuid():
+            sock.close()
+            raise RuntimeError(f"The agent on {self.socket_path} belongs to another user")
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+        return True
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = None
+
+    def request(self, op: str, **kwargs):
+        self._file.write(json.dumps(dict(kwargs, op=op)).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise RuntimeError("Unlock agent closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    import argparse
+    from main import PasswordManagerCore
+
+    parser = argparse.ArgumentParser(description="Hold an unlocked vault for other processes")
+    parser.add_argument("--socket", default=None, help="socket path")
+    parser.add_argument("--idle", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="lock and exit after this many idle seconds")
+    args = parser.parse_args(argv)
+
+    core = PasswordManagerCore()
+    core.load_encryption(getpass.getpass("Master password: "))
+    agent = UnlockAgent(core, args.socket, args.idle)
+    print(f"Agent listening on {agent.socket_path}", file=sys.stderr)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
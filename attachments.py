@@ -0,0 +1,201 @@
+import os
+import hmac
+import base64
+import struct
+import hashlib
+
+# Header: magic, format version, chunk size, plaintext size. It is the
+# associated data of every chunk, so neither size can be changed. Chunks
+# follow back to back, each its AES-GCM ciphertext and 16 byte tag
+MAGIC = b"JATT"
+VERSION = 1
+_HEADER = struct.Struct(">4sB3xIQ")
+TAG_SIZE = 16
+CHUNK_SIZE = 1 << 16
+
+_READ_SIZE = 1 << 20
+
+
+def convergence_key(key: bytes):
+    """Secret that blob keys are derived from, derived from the vault's Fernet key"""
+    return hmac.digest(base64.urlsafe_b64decode(key), b"joker attachment convergence", "sha256")
+
+
+def _content_digest(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(_READ_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.digest()
+
+
+def _blob_key(secret: bytes, content_digest: bytes):
+    # Nyckeln är en HMAC av innehållet, så lika filer delar blob men adressen avslöjar inget
+    key = hmac.digest(secret, content_digest, "sha256")
+    return key, hashlib.sha256(key).hexdigest()
+
+
+def _nonce(index: int, last: bool):
+    # Chunknummer plus en flagga för sista chunken, så att en avkortad blob inte går igenom
+    return index.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+
+
+def blob_path(directory: str, address: str):
+    return os.path.join(directory, address[:2], address)
+
+
+def write_blob(directory: str, secret: bytes, source: str, chunk_size: int = CHUNK_SIZE,
+               progress=None):
+    """Encrypt source into the blob store chunk by chunk, unless already there
+
+    The data key is derived from the content and the convergence secret,
+    so identical files share one blob. Memory use is one chunk whatever the
+    file size. The blob is written to a temporary file and renamed into
+    place, so a blob that exists is always complete. Returns the data key,
+    the blob address and the plaintext size. progress(done, total) is
+    called with byte counts after every chunk.
+    """
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from vault_store import fsync_dir
+
+    content_digest = _content_digest(source)
+    key, address = _blob_key(secret, content_digest)
+    path = blob_path(directory, address)
+    size = os.path.getsize(source)
+    if os.path.exists(path):
+        return key, address, size
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    header = _HEADER.pack(MAGIC, VERSION, chunk_size, size)
+    count = max(1, -(-size // chunk_size))
+    encrypt = AESGCM(key).encrypt
+    digest = hashlib.sha256()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(source, "rb") as f, open(tmp_path, "wb") as out:
+            out.write(header)
+            for index in range(count):
+                chunk = f.read(chunk_size)
+                digest.update(chunk)
+                out.write(encrypt(_nonce(index, index == count - 1), chunk, header))
+                if progress is not None:
+                    progress(min(size, (index + 1) * chunk_size), size)
+            if f.read(1) or digest.digest() != content_digest:
+                raise RuntimeError(f"{source} changed while it was being attached")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(path)
+    return key, address, size
+
+
+class BlobReader:
+    """Decrypting reader for one blob, any chunk readable on its own
+
+    Only the header is read on open. read_chunk(i) seeks to chunk i and
+    authenticates just that chunk, and read(offset, size) touches only the
+    chunks that overlap the range.
+    """
+
+    def __init__(self, path: str, key: bytes):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._header = self._file.read(_HEADER.size)
+        if len(self._header) < _HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not an attachment blob")
+        magic, version, self.chunk_size, self.size = _HEADER.unpack(self._header)
+        if magic != MAGIC or version > VERSION:
+            self._file.close()
+            raise ValueError(f"{path} is not an attachment blob")
+        self.chunk_count = max(1, -(-self.size // self.chunk_size))
+        self._decrypt = AESGCM(key).decrypt
+
+    def __len__(self):
+        return self.size
+
+    def read_chunk(self, index: int):
+        if not 0 <= index < self.chunk_count:
+            raise IndexError(index)
+        self._file.seek(_HEADER.size + index * (self.chunk_size + TAG_SIZE))
+        last = index == self.chunk_count - 1
+        length = (self.size - index * self.chunk_size if last else self.chunk_size) + TAG_SIZE
+        data = self._file.read(length)
+        if len(data) != length:
+            raise ValueError(f"{self.path} is truncated")
+        return self._decrypt(_nonce(index, last), data, self._header)
+
+    def read(self, offset: int = 0, size: int = None):
+        """Plaintext bytes offset to offset + size"""
+        end = self.size if size is None else min(self.size, offset + size)
+        if offset >= end:
+            return b""
+        first, last = offset // self.chunk_size, (end - 1) // self.chunk_size
+        data = b"".join(self.read_chunk(index) for index in range(first, last + 1))
+        start = offset - first * self.chunk_size
+        return data[start:start + end - offset]
+
+    def __iter__(self):
+        for index in range(self.chunk_count):
+            yield self.read_chunk(index)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def save_blob(directory: str, address: str, key: bytes, target: str, progress=None):
+    """Decrypt a blob to target chunk by chunk
+
+    Written to a temporary file first, so a blob that fails authentication
+    halfway leaves no partial plaintext behind.
+    """
+    tmp_path = target + ".tmp"
+    try:
+        with BlobReader(blob_path(directory, address), key) as reader, \
+                open(tmp_path, "wb") as out:
+            done = 0
+            for chunk in reader:
+                out.write(chunk)
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, reader.size)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def prune(directory: str, referenced):
+    """Remove blobs whose address is not in referenced, returns how many"""
+    removed = 0
+    try:
+        buckets = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for bucket in buckets:
+        bucket_path = os.path.join(directory, bucket)
+        if not os.path.isdir(bucket_path):
+            continue
+        for name in os.listdir(bucket_path):
+            # Temporära filer tillhör en bifogning som skrivs just nu
+            if name.endswith(".tmp") or name in referenced:
+                continue
+            os.remove(os.path.join(bucket_path, name))
+            removed += 1
+    return removed
@@ -0,0 +1,234 @@
+"""Benchmarks for PasswordManagerCore and the GUI list refresh
+
+Builds synthetic vaults of each size in a temporary directory and times
+the core operations on them. Results are written as JSON, and compared
+against a stored baseline when there is one:
+
+    python bench.py --save-baseline          # record bench_baseline.json
+    python bench.py                          # compare, exit 1 on regressions
+    python bench.py --sizes 1000 10000 --output results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+BASELINE_PATH = "bench_baseline.json"
+MASTER_PASSWORD = "benchmark master password"
+# Operationer som görs många gånger per mätning rapporteras per anrop
+SAMPLE_OPS = 200
+
+
+def _core(directory):
+    from main import PasswordManagerCore
+
+    core = PasswordManagerCore(vault_dir=directory)
+    core.breach_index_path = os.path.join(directory, "breached.idx")
+    return core
+
+
+def _build_vault(directory, size):
+    """A vault of size entries, compacted into its snapshot like a real one"""
+    source = os.path.join(directory, "synthetic.jsonl")
+    with open(source, "w", encoding="utf-8") as f:
+        for i in range(size):
+            f.write(json.dumps({"website": f"site{i % (size // 3 + 1)}.example.com",
+                                "username": f"user{i}@example.com",
+                                "password": f"synthetic-password-{i}"}) + "\n")
+    core = _core(directory)
+    core.initialize_encryption(MASTER_PASSWORD)
+    core.import_entries(source)
+    core.store.compact(entry.to_record() for entry in core.table)
+    os.remove(source)
+
+
+def _unlocked(directory):
+    core = _core(directory)
+    core.load_encryption(MASTER_PASSWORD)
+    core.preload()
+    return core
+
+
+def _headless_tree():
+    """The list widget's model without a window, when no display is available"""
+    from virtual_tree import VirtualTreeview
+
+    class HeadlessTree(VirtualTreeview):
+        def __init__(self):
+            self.rows = {}
+            self.order = []
+            self.view = self.order
+            self.offset = 0
+            self.visible = 30
+            self.selected = None
+
+        def _render(self):
+            self.offset = max(0, min(self.offset, len(self.view) - self.visible))
+            return self.view[self.offset:self.offset + self.visible]
+
+        def _update_scrollbar(self):
+            pass
+
+    return HeadlessTree()
+
+
+def _list_tree():
+    """A real VirtualTreeview in a withdrawn window, or the headless model"""
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return _headless_tree(), "headless"
+    from virtual_tree import VirtualTreeview
+    root.withdraw()
+    columns = ("website", "username")
+    return VirtualTreeview(root, columns, ("Target", "Alias"), (300, 300)), "tk"
+
+
+def _timed(fn, repeat):
+    # Det snabbaste varvet är minst påverkat av annan last på maskinen
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_size(size, repeat, tree):
+    """Seconds per operation for one vault size"""
+    from gui import JokerEncryptionGUI
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        _build_vault(directory, size)
+        build_seconds = time.perf_counter() - started
+
+        with tempfile.TemporaryDirectory() as empty:
+            results["initialize_encryption"] = _timed(
+                lambda: _core(empty).initialize_encryption(MASTER_PASSWORD), repeat)
+        results["load_encryption"] = _timed(
+            lambda: _core(directory).load_encryption(MASTER_PASSWORD), repeat)
+        results["preload"] = _timed(lambda: _core(directory).preload(), repeat)
+
+        core = _unlocked(directory)
+        rng = random.Random(size)
+        ids = [entry.id for entry in core.table]
+        sample = [rng.choice(ids) for _ in range(SAMPLE_OPS)]
+
+        results["get"] = _timed(lambda: [core.get(entry_id) for entry_id in sample],
+                                repeat) / SAMPLE_OPS
+        websites = [core.get(entry_id)["website"] for entry_id in sample]
+        results["find"] = _timed(lambda: [core.find(website) for website in websites],
+                                 repeat) / SAMPLE_OPS
+        results["reveal_password"] = _timed(
+            lambda: [core.reveal_password(core.get(entry_id)) for entry_id in sample],
+            repeat) / SAMPLE_OPS
+        core.warm_search_index()
+        queries = [website[:7] for website in websites]
+        results["search"] = _timed(lambda: [core.search(query) for query in queries],
+                                   repeat) / SAMPLE_OPS
+        results["load_passwords"] = _timed(lambda: sum(1 for _ in core.load_passwords()), repeat)
+        # Första varvet poängsätter allt, resten bara det som ändrats
+        results["password_health"] = _timed(core.password_health, repeat)
+
+        gui = SimpleNamespace(core=core, tree=tree)
+        results["refresh_list"] = _timed(lambda: JokerEncryptionGUI.refresh_list(gui), repeat)
+
+        saved = []
+
+        def save():
+            saved.extend(core.save_password_entry({"website": "bench.example.com",
+                                                   "username": f"bench{i}", "password": "x"})
+                         for i in range(SAMPLE_OPS // 10))
+        results["save_password_entry"] = _timed(save, repeat) / (SAMPLE_OPS // 10)
+
+        def delete():
+            for _ in range(SAMPLE_OPS // 10):
+                core.delete(saved.pop())
+        results["delete"] = _timed(delete, repeat) / (SAMPLE_OPS // 10)
+
+    return results, build_seconds
+
+
+def compare(results, baseline, tolerance, floor):
+    """Regressions as (size, operation, baseline seconds, current seconds)
+
+    An operation regresses when it got more than tolerance times slower
+    and by more than floor seconds, which keeps timer noise on the
+    microsecond operations from failing the run.
+    """
+    regressions = []
+    for size, operations in results.items():
+        for operation, seconds in operations.items():
+            before = baseline.get(size, {}).get(operation)
+            if before is None:
+                continue
+            if seconds > before * tolerance and seconds - before > floor:
+                regressions.append((size, operation, before, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PasswordManagerCore")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=5, help="runs per operation, the fastest counts")
+    parser.add_argument("--output", default=None, help="write the results JSON here")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="slowdown factor that counts as a regression")
+    parser.add_argument("--floor", type=float, default=0.002,
+                        help="ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args(argv)
+
+    tree, tree_kind = _list_tree()
+    results = {}
+    for size in args.sizes:
+        operations, build_seconds = bench_size(size, args.repeat, tree)
+        results[str(size)] = operations
+        print(f"{size} entries (built in {build_seconds:.1f} s)", file=sys.stderr)
+        for operation, seconds in operations.items():
+            print(f"  {operation:<24}{seconds * 1000:12.3f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "tree": tree_kind, "repeat": args.repeat,
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, run with --save-baseline first", file=sys.stderr)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, args.floor)
+    for size, operation, before, seconds in regressions:
+        print(f"REGRESSION {operation} at {size} entries: "
+              f"{before * 1000:.3f} ms -> {seconds * 1000:.3f} ms", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import os
+import sys
+import mmap
+import heapq
+import shutil
+import struct
+import hashlib
+import tempfile
+from contextlib import nullcontext
+
+# Header: magic, format version, record count, then a fan-out table with the
+# number of records whose hash starts with each two byte prefix or a lower
+# one. Records are a SHA-1 hash and how often it was seen, sorted by hash
+MAGIC = b"JBRH"
+VERSION = 1
+_HEADER = struct.Struct(">4sB3xQ")
+_FANOUT = struct.Struct(">65536Q")
+_RECORD = struct.Struct(">20sI")
+RECORD_SIZE = _RECORD.size
+DATA_START = _HEADER.size + _FANOUT.size
+
+# Poster per sorterad delfil när indata inte redan är sorterad
+RUN_SIZE = 4_000_000
+
+
+def _parse(lines):
+    """Yield packed records from HIBP lines like 'HEX:COUNT'"""
+    pack = _RECORD.pack
+    for line in lines:
+        digest, _, count = line.partition(b":")
+        digest = digest.strip()
+        if len(digest) != 40:
+            continue
+        count = int(count) if count.strip() else 1
+        yield pack(bytes.fromhex(digest.decode()), min(count, 0xFFFFFFFF))
+
+
+def build_index(source: str, path: str, run_size: int = RUN_SIZE, progress=None):
+    """Build a sorted breach index from a HIBP style SHA-1 hash list
+
+    The source is read once. It is cut into runs of run_size records that
+    are sorted in memory and spilled to temporary files, which are then
+    merged, so memory stays bounded by one run however long the list is.
+    Already sorted input, as HIBP ships it, is concatenated instead of
+    merged. progress(count, None) is called after every run.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        runs = []
+        in_order = True
+        last = b""
+        count = 0
+        with open(source, "rb") as f:
+            records = _parse(f)
+            while True:
+                run = [record for _, record in zip(range(run_size), records)]
+                if not run:
+                    break
+                if in_order and (run[0] < last or any(a > b for a, b in zip(run, run[1:]))):
+                    in_order = False
+                run.sort()
+                last = run[-1]
+                run_path = os.path.join(scratch, f"run{len(runs)}")
+                with open(run_path, "wb") as out:
+                    out.write(b"".join(run))
+                runs.append(run_path)
+                count += len(run)
+                del run
+                if progress is not None:
+                    progress(count, None)
+
+        merged = os.path.join(scratch, "merged")
+        with open(merged, "wb") as out:
+            if in_order:
+                for run_path in runs:
+                    with open(run_path, "rb") as run_file:
+                        shutil.copyfileobj(run_file, out, 1 << 20)
+            else:
+                files = [open(run_path, "rb") for run_path in runs]
+                try:
+                    streams = [iter(lambda f=f: f.read(RECORD_SIZE), b"") for f in files]
+                    buffer = []
+                    for record in heapq.merge(*streams):
+                        buffer.append(record)
+                        if len(buffer) >= 65536:
+                            out.write(b"".join(buffer))
+                            buffer = []
+                    out.write(b"".join(buffer))
+                finally:
+                    for f in files:
+                        f.close()
+
+        _write_index(merged, path, count)
+    return count
+
+
+def _write_index(merged: str, path: str, count: int):
+    # Sorterad data, så varje prefixgräns hittas med en binärsökning
+    fanout = []
+    low = 0
+    with open(merged, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if count else nullcontext(b"") as data:
+        for prefix in range(1, 65536):
+            bound = prefix.to_bytes(2, "big")
+            high = count
+            while low < high:
+                middle = (low + high) // 2
+                start = middle * RECORD_SIZE
+                if data[start:start + 2] < bound:
+                    low = middle + 1
+                else:
+                    high = middle
+            fanout.append(low)
+    fanout.append(count)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as out, open(merged, "rb") as f:
+        out.write(_HEADER.pack(MAGIC, VERSION, count))
+        out.write(_FANOUT.pack(*fanout))
+        shutil.copyfileobj(f, out, 1 << 20)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+
+
+class BreachIndex:
+    """Memory-mapped breach index, looked up by binary search
+
+    The fan-out table narrows a lookup to the records sharing the first two
+    bytes of the hash, a few thousand even for the full HIBP list, so a
+    lookup touches a handful of pages and memory use does not grow with
+    the size of the list.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version > VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a breach index")
+        self._fanout = _FANOUT.unpack_from(self._map, _HEADER.size)
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, digest: bytes):
+        """How often a SHA-1 digest was seen in breaches, 0 if never"""
+        prefix = (digest[0] << 8) | digest[1]
+        low = self._fanout[prefix - 1] if prefix else 0
+        high = self._fanout[prefix]
+        data = self._map
+        while low < high:
+            middle = (low + high) // 2
+            start = DATA_START + middle * RECORD_SIZE
+            found = data[start:start + 20]
+            if found < digest:
+                low = middle + 1
+            elif found > digest:
+                high = middle
+            else:
+                return _RECORD.unpack_from(data, start)[1]
+        return 0
+
+    def count_password(self, password: str):
+        return self.lookup(hashlib.sha1(password.encode()).digest())
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"usage: {sys.argv[0]} HASHES.txt INDEX", file=sys.stderr)
+        sys.exit(2)
+    total = build_index(sys.argv[1], sys.argv[2],
+                        progress=lambda count, _: print(f"{count} hashes", file=sys.stderr))
+    print(f"Indexed {total} hashes into {sys.argv[2]}")
@@ -0,0 +1,77 @@
+import os
+import csv
+import json
+
+FIELDS = ("website", "username", "password")
+
+# Kolumnnamn som andra lösenordshanterare använder i sina exporter
+ALIASES = {
+    "website": ("website", "url", "login_uri", "uri", "name", "title"),
+    "username": ("username", "login_username", "login", "user", "email"),
+    "password": ("password", "login_password", "pass"),
+}
+
+
+def detect_format(path: str):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_entries(path: str, fmt: str = None):
+    """Yield entries from a CSV or JSON Lines file one at a time"""
+    fmt = fmt or detect_format(path)
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            rows = csv.DictReader(f)
+        elif fmt == "jsonl":
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        for number, row in enumerate(rows, 1):
+            entry = _normalize(row)
+            if entry is None:
+                raise ValueError(f"Row {number} is missing website, username or password")
+            yield entry
+
+
+def write_entries(path: str, entries, fmt: str = None):
+    """Write entries to a CSV or JSON Lines file, replacing it atomically"""
+    fmt = fmt or detect_format(path)
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    tmp_path = path + ".tmp"
+    # Exporten innehåller klartext, så bara ägaren får läsa den
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    count = 0
+    try:
+        with open(fd, "w", newline="", encoding="utf-8") as f:
+            if fmt == "csv":
+                writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                write = writer.writerow
+            else:
+                write = lambda entry: f.write(json.dumps({k: entry[k] for k in FIELDS}) + "\n")
+            for entry in entries:
+                write(entry)
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        # En halvskriven export innehåller klartextlösenord, lämna den inte kvar
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+def _normalize(row: dict):
+    lowered = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    entry = {}
+    for field, names in ALIASES.items():
+        value = next((lowered[name] for name in names if lowered.get(name)), None)
+        if value is None:
+            return None
+        entry[field] = str(value)
+    return entry
@@ -0,0 +1,362 @@
+import time
+_START = time.perf_counter()
+
+import os
+import sys
+import json
+import argparse
+
+# Inget tkinter och ingen cryptography förrän valvet faktiskt låses upp
+
+PASSWORD_ENV = "JOKER_MASTER_PASSWORD"
+
+
+class LocalSession:
+    """Unlock the vault in this process, same requests as AgentClient"""
+
+    def __init__(self, core=None):
+        if core is None:
+            from main import PasswordManagerCore
+            core = PasswordManagerCore()
+        self.core = core
+
+    def unlock(self):
+        if not self.core.has_key_file():
+            raise RuntimeError("No vault here yet, create one with the GUI first")
+        password = os.environ.get(PASSWORD_ENV)
+        if password is None:
+            import getpass
+            password = getpass.getpass("Master password: ", stream=sys.stderr)
+        from cryptography.exceptions import InvalidKey
+        try:
+            self.core.load_encryption(password)
+        except InvalidKey as e:
+            raise RuntimeError(str(e))
+
+    def request(self, op: str, **kwargs):
+        from agent import dispatch
+        return dispatch(self.core, dict(kwargs, op=op))
+
+    def close(self):
+        self.core.lock()
+
+
+class VaultSetSession:
+    """Several named vaults unlocked together, for search and get"""
+
+    def __init__(self, names=None):
+        from vault_set import VaultSet
+        self.vaults = VaultSet()
+        self.names = names or self.vaults.names()
+
+    def unlock(self):
+        if not self.names:
+            raise RuntimeError("No vaults here yet, create one with the GUI first")
+        password = os.environ.get(PASSWORD_ENV)
+        passwords = {}
+        for name in self.names:
+            if not self.vaults.core(name).has_key_file():
+                raise RuntimeError(f"No vault named {name}")
+            if password is None:
+                import getpass
+                passwords[name] = getpass.getpass(f"Master password for {name}: ", stream=sys.stderr)
+            else:
+                passwords[name] = password
+        # Nycklarna härleds parallellt, ett valv som inte låses upp hoppas över
+        failed = self.vaults.unlock(passwords)
+        for name, error in failed.items():
+            print(f"error: vault {name}: {str(error) or 'Invalid master password'}", file=sys.stderr)
+        if len(failed) == len(passwords):
+            raise RuntimeError("No vault could be unlocked")
+
+    def request(self, op: str, **kwargs):
+        from agent import dispatch
+        if op == "search":
+            return [dict(dispatch(self.vaults.core(name), {"op": "get", "id": entry_id}), vault=name)
+                    for name, entry_id in self.vaults.search(kwargs["query"])]
+        if op == "find":
+            return [{key: value for key, value in record.items() if key != "password"}
+                    for record in self.vaults.find(kwargs.get("website"), kwargs.get("username"))]
+        if op == "reveal":
+            return dispatch(self.vaults.core(kwargs["vault"]), dict(kwargs, op=op))
+        raise ValueError(f"{op} works on one vault at a time")
+
+    def close(self):
+        self.vaults.lock()
+
+
+def open_session(args, local_only=False, several=False):
+    """Use a running unlock agent for the vault when there is one, otherwise unlock locally
+
+    An agent only counts if its ping names the same vault, and one that
+    fails to answer, say after it locked itself, is passed over. With several
+    --vault options or --all-vaults, which only search and get take, the
+    vaults are unlocked locally as a VaultSet.
+    """
+    names = args.vault or []
+    if args.all_vaults or len(names) > 1:
+        if not several:
+            raise ValueError(f"{args.command} works on one vault at a time")
+        session = VaultSetSession(None if args.all_vaults else names)
+        session.unlock()
+        return session
+
+    vault_dir = None
+    if names:
+        from vault_set import VaultSet
+        vault_dir = VaultSet().path(names[0])
+    if not local_only and not args.no_agent:
+        from agent import AgentClient, vault_identity
+        client = AgentClient(args.socket, vault_dir=vault_dir)
+        if client.connect():
+            try:
+                identity = client.request("ping")
+            except (RuntimeError, OSError, ValueError):
+                # Agenten kan ha låst sig efter ett lösenordsbyte, då låser vi upp här
+                identity = None
+            if identity == vault_identity(vault_dir):
+                return client
+            client.close()
+    from main import PasswordManagerCore
+    session = LocalSession(PasswordManagerCore(vault_dir=vault_dir))
+    session.unlock()
+    return session
+
+
+def read_queries(queries):
+    """Queries from the command line, or one per line from stdin for - or none"""
+    if queries and queries != ["-"]:
+        return queries
+    return [line.strip() for line in sys.stdin if line.strip()]
+
+
+def emit(args, record, *fields):
+    if args.json:
+        print(json.dumps({field: record.get(field) for field in fields}))
+    else:
+        print("\t".join(str(record.get(field, "")) for field in fields))
+
+
+def cmd_get(args):
+    session = open_session(args, several=True)
+    fields = ("vault",) * isinstance(session, VaultSetSession) + ("website", "username", "password")
+    missing = 0
+    try:
+        for website in read_queries(args.websites):
+            entries = session.request("find", website=website, username=args.username)
+            if not entries:
+                print(f"not found: {website}", file=sys.stderr)
+                missing += 1
+            for entry in entries:
+                entry["password"] = session.request("reveal", id=entry["id"], vault=entry.get("vault"))
+                emit(args, entry, *fields)
+    finally:
+        session.close()
+    return 1 if missing else 0
+
+
+def cmd_search(args):
+    session = open_session(args, several=True)
+    fields = ("query",) + ("vault",) * isinstance(session, VaultSetSession) + ("id", "website", "username")
+    try:
+        for query in read_queries(args.queries):
+            for entry in session.request("search", query=query):
+                emit(args, dict(entry, query=query), *fields)
+    finally:
+        session.close()
+    return 0
+
+
+def cmd_list(args):
+    session = open_session(args)
+    try:
+        for entry in session.request("list"):
+            emit(args, entry, "id", "website", "username")
+    finally:
+        session.close()
+    return 0
+
+
+def cmd_add(args):
+    password = args.password
+    if password is None:
+        if sys.stdin.isatty():
+            import getpass
+            password = getpass.getpass(f"Password for {args.username}@{args.website}: ",
+                                       stream=sys.stderr)
+        else:
+            password = sys.stdin.readline().rstrip("\n")
+    if not password:
+        print("error: empty password", file=sys.stderr)
+        return 1
+
+    session = open_session(args)
+    try:
+        entry_id = session.request("add", entry={
+            "website": args.website, "username": args.username, "password": password})
+    finally:
+        session.close()
+    print(entry_id)
+    return 0
+
+
+def cmd_import(args):
+    session = open_session(args, local_only=True)
+    try:
+        count = session.core.import_entries(args.path, args.format)
+    finally:
+        session.close()
+    print(f"imported {count} entries", file=sys.stderr)
+    return 0
+
+
+def cmd_export(args):
+    session = open_session(args, local_only=True)
+    try:
+        count = session.core.export_entries(args.path, args.format)
+    finally:
+        session.close()
+    print(f"exported {count} entries", file=sys.stderr)
+    return 0
+
+
+def cmd_bench(args):
+    """Time the common operations against a throwaway vault"""
+    import tempfile
+    import keyfile
+    from main import PasswordManagerCore
+
+    if args.entries < 1:
+        raise ValueError("bench needs at least one entry")
+    if args.queries < 0:
+        raise ValueError("bench cannot run a negative number of queries")
+    timings = {"startup": time.perf_counter() - _START}
+    with tempfile.TemporaryDirectory() as tmp:
+        def fresh_core():
+            return PasswordManagerCore(kdf_params=dict(keyfile.DEFAULT_KDF), vault_dir=tmp)
+
+        source = os.path.join(tmp, "bench.jsonl")
+        with open(source, "w", encoding="utf-8") as f:
+            for i in range(args.entries):
+                f.write(json.dumps({"website": f"site{i}.example.com", "username": f"user{i}",
+                                    "password": f"password-{i}"}) + "\n")
+
+        core = fresh_core()
+        started = time.perf_counter()
+        core.initialize_encryption("benchmark password")
+        timings["create key"] = time.perf_counter() - started
+        started = time.perf_counter()
+        core.import_entries(source)
+        timings["import"] = time.perf_counter() - started
+
+        core = fresh_core()
+        started = time.perf_counter()
+        core.load_encryption("benchmark password")
+        timings["unlock"] = time.perf_counter() - started
+        started = time.perf_counter()
+        core.preload()
+        timings["load"] = time.perf_counter() - started
+        started = time.perf_counter()
+        core.warm_search_index()
+        timings["index"] = time.perf_counter() - started
+
+        queries = [f"site{i * 7919 % args.entries}" for i in range(args.queries)]
+        started = time.perf_counter()
+        for query in queries:
+            core.search(query)
+        timings[f"search x{len(queries)}"] = time.perf_counter() - started
+        started = time.perf_counter()
+        for query in queries:
+            for entry in core.find(f"{query}.example.com"):
+                core.reveal_password(entry)
+        timings[f"get x{len(queries)}"] = time.perf_counter() - started
+
+    for name, seconds in timings.items():
+        if args.json:
+            print(json.dumps({"operation": name, "entries": args.entries, "ms": seconds * 1000}))
+        else:
+            print(f"{name:<16}{seconds * 1000:10.1f} ms")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="joker", description="Joker Encryption from the command line")
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    parser.add_argument("--no-agent", action="store_true", help="never use a running unlock agent")
+    parser.add_argument("--socket", default=None, help="unlock agent socket path")
+    parser.add_argument("--vault", action="append", default=None,
+                        help="named vault under vaults/ instead of this directory, search and get take several")
+    parser.add_argument("--all-vaults", action="store_true", help="search and get in every vault")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    get = commands.add_parser("get", help="print passwords for websites")
+    get.add_argument("websites", nargs="*", help="websites, - or nothing to read them from stdin")
+    get.add_argument("-u", "--username", default=None, help="only this account")
+    get.set_defaults(func=cmd_get)
+
+    search = commands.add_parser("search", help="search websites and usernames")
+    search.add_argument("queries", nargs="*", help="queries, - or nothing to read them from stdin")
+    search.set_defaults(func=cmd_search)
+
+    listing = commands.add_parser("list", help="list every entry without passwords")
+    listing.set_defaults(func=cmd_list)
+
+    add = commands.add_parser("add", help="add an entry")
+    add.add_argument("website")
+    add.add_argument("username")
+    add.add_argument("-p", "--password", default=None,
+                     help="password, prompted or read from stdin when left out")
+    add.set_defaults(func=cmd_add)
+
+    for name, func, verb in (("import", cmd_import, "read"), ("export", cmd_export, "write")):
+        command = commands.add_parser(name, help=f"{name} CSV or JSON Lines")
+        command.add_argument("path", help=f"file to {verb}")
+        command.add_argument("-f", "--format", choices=("csv", "jsonl"), default=None,
+                             help="defaults to the file extension")
+        command.set_defaults(func=func)
+
+    bench = commands.add_parser("bench", help="time vault operations on a throwaway vault")
+    bench.add_argument("-n", "--entries", type=int, default=1000)
+    bench.add_argument("-q", "--queries", type=int, default=100)
+    bench.set_defaults(func=cmd_bench)
+    return parser
+
+
+def _error_message(error):
+    """One line for an error the user can act on, None for a bug worth a traceback"""
+    if isinstance(error, (RuntimeError, ValueError, KeyError, OSError)):
+        return str(error)
+    # termios och cryptography importeras bara när felet väl har inträffat
+    try:
+        import termios
+    except ImportError:
+        pass
+    else:
+        if isinstance(error, termios.error):
+            return f"cannot prompt for the master password without a terminal, set {PASSWORD_ENV}"
+    try:
+        from cryptography.fernet import InvalidToken
+    except ImportError:
+        pass
+    else:
+        if isinstance(error, InvalidToken):
+            return "an entry could not be decrypted, the vault may be damaged"
+    return None
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        message = _error_message(e)
+        if message is None:
+            raise
+        print(f"error: {message}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,49 @@
-import os
-import json
+import time
+_START = time.perf_counter()
+
+import sys
 import random
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-from main import PasswordManagerCore
+from tkinter import ttk, messagebox, simpledialog, filedialog
+from main import PasswordManagerCore, KeyChangedError
+from password_health import entropy_bits, WEAK_BITS
+from write_queue import BackgroundWriter
+from startup_profile import StartupProfiler, NullProfiler
+from virtual_tree import VirtualTreeview
+from particles import SmokeEngine
 import string
 
+_IMPORTED = time.perf_counter()
+
 class JokerEncryptionGUI:
-    def __init__(self, root):
-        self.core = PasswordManagerCore()
+    def __init__(self, root, profiler=None, vault_dir=None):
+        self.core = PasswordManagerCore(vault_dir=vault_dir)
         self.root = root
         self.root.withdraw()
+        self.profiler = profiler or NullProfiler()
         self.chaos_mode = False
-        self.setup_styles()
-        self.create_splash_screen()
-        self.root.after(20000, self.initialize_app)
+        with self.profiler.phase("style setup"):
+            self.setup_styles()
         self.current_quote = 0
-        self.smoke_particles = []
+        self.smoke = None
+        self.chaos_after = None
+        self.unlock_future = None
+        self.agent = None
+        self.writer = BackgroundWriter(self.core, on_commit=self.record_commit)
+        self.pending_writes = []
+        self.unlocking_again = False
+        self.search_warming = None
+        self.search_retry = None
+        self.last_commit = None
+        with self.profiler.phase("splash"):
+            self.create_splash_screen()
+        # Låt splashen ritas innan laddningen börjar
+        self.root.after(10, self.start_loading)
 
     def create_splash_screen(self):
-        """Create splash screen with animated status messages"""
+        """Create splash screen with loading stage messages"""
+        self.status_text = None
+        self.splash_progress = None
         self.splash = tk.Toplevel(self.root)
         self.splash.overrideredirect(True)
         self.splash.configure(background=self.colors['background'])
@@ -65,82 +89,67 @@ class JokerEncryptionGUI:
             )
             self.splash_progress.pack(pady=15)
 
-            # Starta animationen
-            self.update_loading_message()
-            self.update_progress()
-
         except Exception as e:
             messagebox.showwarning("Logo Error", f"Could not load logo image: {str(e)}")
             self.splash.destroy()
 
     def animate_smoke(self):
         """Create green and purple smoke animation effect"""
-        if self.chaos_mode:
-            self.smoke_canvas = tk.Canvas(self.root, bg=self.colors['background'], 
+        if not self.chaos_mode:
+            if self.smoke is not None:
+                self.smoke.stop()
+            return
+
+        if self.smoke is None:
+            # Canvasen ligger under resten av fönstret, röken syns i kanterna
+            self.smoke_canvas = tk.Canvas(self.root, bg=self.colors['background'],
                                         highlightthickness=0)
             self.smoke_canvas.place(relwidth=1, relheight=1)
-
-            def create_particle():
-                x = random.randint(0, self.root.winfo_width())
-                y = self.root.winfo_height()
-                colors = ['#39ff14', '#7a00cc']
-                particle = self.smoke_canvas.create_oval(
-                    x, y, x+30, y+30,
-                    fill=random.choice(colors),
-                    width=0,
-                    alpha=.3
-                )
-                self.smoke_particles.append(particle)
-
-            def move_particles():
-                for particle in self.smoke_particles:
-                    self.smoke_canvas.move(
-                        particle,
-                        random.randint(-2, 2),
-                        random.randint(-10, -5)
-                    )
-                    self.smoke_canvas.itemconfig(
-                        particle,
-                        alpha=max(0, float(self.smoke_canvas.itemcget(particle, "alpha")) - 0.01)
-                    )
-                self.root.after(50, move_particles)
-
-            self.root.after(100, create_particle)
-            self.root.after(100, move_particles)
-
-    def update_loading_message(self):
-        """Cycle through security status messages"""
-        messages = [
-            "Injecting Chaos Serum...",
-            "Corrupting Gotham Databases...",
-            "Activating Laughing Gas Protocol...",
-            "Encrypting with Ha-Ha-Hybrid Algorithm...",
-            "Initializing Smilex Encryption...",
-            "Synchronizing Chaos Theory Patterns..."
-        ]
-        new_msg = random.choice(messages)
-        self.status_text.config(text=new_msg)
-        self.splash.after(3000, self.update_loading_message)
-
-    def update_progress(self):
-        """Animate progress bar"""
-        current = self.splash_progress['value']
-        if current < 100:
-            increment = random.uniform(0.5, 2.5)
-            self.splash_progress['value'] = min(current + increment, 100)
-            self.splash.after(100, self.update_progress)
+            self.smoke_canvas.lower()
+            self.smoke = SmokeEngine(self.smoke_canvas, ['#39ff14', '#7a00cc'],
+                                     self.colors['background'])
+        self.smoke.start()
+
+    def set_loading_stage(self, message, progress):
+        """Show a real loading stage on the splash screen"""
+        if self.status_text is None or not self.splash.winfo_exists():
+            return
+        self.status_text.config(text=message)
+        self.splash_progress['value'] = progress
+        self.splash.update_idletasks()
+
+    def start_loading(self):
+        """Check the key file, start the preload and build the UI"""
+        self.set_loading_stage("Sniffing for the Chaos Cipher key...", 10)
+        self.key_file_found = self.core.has_key_file()
+
+        self.set_loading_stage("Corrupting Gotham Databases...", 25)
+        self.profiler.begin("vault load")
+        self.preload_future = self.core.preload_async()
+        self.preload_future.add_done_callback(lambda f: self.profiler.end("vault load"))
+        self.preload_future.add_done_callback(self.warm_after_preload)
+
+        self.set_loading_stage("Building the funhouse...", 40)
+        with self.profiler.phase("ui build"):
+            self.setup_ui()
+
+        self.set_loading_stage("Why so serious?", 100)
+        # Lösenordsrutan väntar inte på förladdningen, upplåsningen köas efter den på samma arbetstråd
+        self.initialize_app()
+
+    def warm_after_preload(self, future):
+        """Start the search index once the vault is loaded, runs on the worker thread"""
+        # Load errors are reported by refresh_list after unlocking
+        if future.exception() is None:
+            self.core.warm_search_index_async()
 
     def initialize_app(self):
         """Cleanup splash and start main app"""
-        try:
+        if self.splash.winfo_exists():
             self.splash.destroy()
-            self.root.after_cancel(self.update_loading_message)
-            self.root.after_cancel(self.update_progress)
-        except:
-            pass
-        
+
         self.root.deiconify()
-        self.setup_ui()
+        self.profiler.record("interactive", self.profiler.origin, time.perf_counter())
         self.check_initialization()
         self.root.config(cursor="spider")
         self.animate_smoke()
@@ -219,8 +228,13 @@ class JokerEncryptionGUI:
     def toggle_chaos_mode(self):
         """Activate random color chaos"""
         self.chaos_mode = not self.chaos_mode
+        if self.chaos_after is not None:
+            # Annars startar varje ny växling en loop till
+            self.root.after_cancel(self.chaos_after)
+            self.chaos_after = None
         if self.chaos_mode:
             self.animate_chaos_colors()
+        self.animate_smoke()
 
     def animate_chaos_colors(self):
         """Randomly change accent colors"""
@@ -234,11 +248,11 @@ class JokerEncryptionGUI:
             self.status_bar.config(foreground=new_color)
             
             # Recall efter 2 seconds
-            self.root.after(2000, self.animate_chaos_colors)
+            self.chaos_after = self.root.after(2000, self.animate_chaos_colors)
 
     def check_initialization(self):
         """Check if encryption system is initialized"""
-        if not os.path.exists("chaos_cipher.key"):
+        if not self.key_file_found:
             self.show_first_run_wizard()
         else:
             self.authenticate_user()
@@ -252,27 +266,84 @@ class JokerEncryptionGUI:
             messagebox.showerror("Error", "Let's put a smile on that password! Too short!")
             self.root.destroy()
             return
-        try:
-            self.core.initialize_encryption(pw)
-            messagebox.showinfo("Success", "System initialized!\nNow let's make some magic!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Something went wrong: {str(e)}")
-            self.root.destroy()
+        self.start_unlock(pw, create=True)
 
     def authenticate_user(self):
         """Password authentication dialog"""
-        while True:
-            pw = simpledialog.askstring("Authentication", 
-                                      "Enter master password:\nLet's see your best trick!", 
-                                      show='*')
-            if not pw:
+        pw = simpledialog.askstring("Authentication", 
+                                  "Enter master password:\nLet's see your best trick!", 
+                                  show='*')
+        if not pw:
+            self.root.destroy()
+            return
+        self.start_unlock(pw)
+
+    def start_unlock(self, pw, create=False):
+        """Derive the key on a worker thread while showing progress"""
+        self.unlock_create = create
+        self.profiler.begin("kdf")
+        self.unlock_future = self.core.unlock_async(pw, create=create, calibrate=create,
+                                                    callback=lambda f: self.profiler.end("kdf"))
+
+        self.unlock_window = tk.Toplevel(self.root)
+        self.unlock_window.title("Summoning the Key")
+        self.unlock_window.configure(bg=self.colors['background'])
+        self.unlock_window.transient(self.root)
+        self.unlock_window.protocol("WM_DELETE_WINDOW", self.cancel_unlock)
+
+        ttk.Label(self.unlock_window, text="Deriving the chaos key...",
+                foreground=self.colors['accent']).pack(padx=20, pady=(20, 10))
+        progress = ttk.Progressbar(self.unlock_window, orient='horizontal',
+                                   mode='indeterminate', length=250,
+                                   style='Joker.Horizontal.TProgressbar')
+        progress.pack(padx=20, pady=10)
+        progress.start(15)
+        ttk.Button(self.unlock_window, text="Cancel",
+                 command=self.cancel_unlock).pack(pady=(5, 20))
+        self.unlock_window.grab_set()
+
+        self.root.after(50, self.poll_unlock, self.unlock_future)
+
+    def poll_unlock(self, future):
+        """Wait for the unlock future without blocking the event loop"""
+        if future is not self.unlock_future:
+            return
+        if not future.done():
+            self.root.after(50, self.poll_unlock, future)
+            return
+
+        self.unlock_window.destroy()
+        self.unlock_future = None
+        try:
+            future.result()
+        except Exception as e:
+            if self.unlock_create:
+                messagebox.showerror("Error", f"Something went wrong: {str(e)}")
                 self.root.destroy()
-                return
-            try:
-                self.core.load_encryption(pw)
-                break
-            except Exception as e:
+            else:
                 messagebox.showerror("Error", f"Wrong move! {str(e)}")
+                self.authenticate_user()
+            return
+
+        self.unlocking_again = False
+        if self.unlock_create:
+            messagebox.showinfo("Success", "System initialized!\nNow let's make some magic!")
+        with self.profiler.phase("first tree render"):
+            self.refresh_list()
+        # Rapporten gäller bara första starten
+        self.profiler.report()
+        self.profiler = NullProfiler()
+
+    def cancel_unlock(self):
+        """Abandon the running key derivation and ask again"""
+        if self.unlock_future is None or not self.core.cancel_unlock():
+            return
+        self.unlock_window.destroy()
+        self.unlock_future = None
+        if self.unlock_create:
+            self.show_first_run_wizard()
+        else:
+            self.authenticate_user()
 
     def setup_ui(self):
         """Initialize main application UI"""
@@ -280,11 +351,21 @@ class JokerEncryptionGUI:
         self.root.geometry("900x700")
         self.root.minsize(400, 600)
         self.root.configure(bg=self.colors['background'])
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Chaos Mode menu
         menubar = tk.Menu(self.root)
         chaos_menu = tk.Menu(menubar, tearoff=0)
         chaos_menu.add_command(label="Toggle Chaos Mode", command=self.toggle_chaos_mode)
+        chaos_menu.add_separator()
+        chaos_menu.add_command(label="Smuggle Secrets In...", command=self.import_secrets)
+        chaos_menu.add_command(label="Smuggle Secrets Out...", command=self.export_secrets)
+        chaos_menu.add_command(label="Change Master Password...", command=self.change_master_password)
+        chaos_menu.add_command(label="Check for Leaks...", command=self.audit_breaches)
+        chaos_menu.add_command(label="Sanity Check...", command=self.check_health)
+        chaos_menu.add_separator()
+        chaos_menu.add_command(label="Lend Keys to Accomplices", command=self.toggle_agent)
+        chaos_menu.add_command(label="Diagnostics...", command=self.show_diagnostics)
         menubar.add_cascade(label="Madness", menu=chaos_menu)
         self.root.config(menu=menubar)
 
@@ -338,23 +419,22 @@ class JokerEncryptionGUI:
         right_frame = ttk.LabelFrame(content_frame, text="Stored Secrets")
         right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
 
-        # Treeview with scrollbar
+        # Search-as-you-type filter, never decrypts anything
+        search_frame = ttk.Frame(right_frame)
+        search_frame.pack(fill=tk.X, pady=(5, 8))
+
+        ttk.Label(search_frame, text="🔍 Hunt", width=8).pack(side=tk.LEFT, padx=5)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.apply_search())
+        ttk.Entry(search_frame, textvariable=self.search_var).pack(fill=tk.X, expand=True, padx=5)
+
+        # Treeview with scrollbar, only the visible rows exist as widget items
         tree_frame = ttk.Frame(right_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True)
 
-        self.tree = ttk.Treeview(tree_frame, columns=("website", "username"), 
-                               show="headings", selectmode="browse")
-        
-        self.tree.heading("website", text="Shadow Network", anchor=tk.W)
-        self.tree.heading("username", text="Alter Ego", anchor=tk.W)
-        self.tree.column("website", width=200)
-        self.tree.column("username", width=150)
-        
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
-        
-        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree = VirtualTreeview(tree_frame, columns=("website", "username"),
+                                    headings=("Shadow Network", "Alter Ego"),
+                                    widths=(200, 150))
 
         # Context menu
         self.context_menu = tk.Menu(self.root, tearoff=0)
@@ -374,17 +454,34 @@ class JokerEncryptionGUI:
                                   background=self.colors['secondary'])
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
-        self.refresh_list()
-
     def refresh_list(self):
-        """Refresh secret list"""
-        self.tree.delete(*self.tree.get_children())
+        """Reload the whole secret list, only needed after unlocking"""
         try:
-            for entry in self.core.load_passwords():
-                self.tree.insert("", tk.END, values=(entry["website"], entry["username"]))
+            self.tree.set_rows((entry["id"], (entry["website"], entry["username"]))
+                               for entry in self.core.list_entries())
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load secrets: {str(e)}")
 
+    def apply_search(self):
+        """Filter the secret list with the search index"""
+        query = self.search_var.get()
+        if not query.strip():
+            self.tree.set_filter(None)
+            return
+        found = self.core.search(query, wait=False)
+        if found is None:
+            # Indexet byggs på en egen tråd, filtrera när det är klart i stället för att frysa
+            if self.search_warming is None or not self.search_warming.is_alive():
+                self.search_warming = self.core.warm_search_index_async()
+            if self.search_retry is None:
+                self.search_retry = self.root.after(100, self.retry_search)
+            return
+        self.tree.set_filter(found)
+
+    def retry_search(self):
+        self.search_retry = None
+        self.apply_search()
+
     def save_entry(self):
         """Save new secret entry"""
         entry = {
@@ -397,20 +494,40 @@ class JokerEncryptionGUI:
             messagebox.showwarning("Error", "All fields must be filled!\nThe devil's in the details...")
             return
 
-        try:
-            self.core.save_password_entry(entry)
-            self.refresh_list()
-            self.entry_website.delete(0, tk.END)
-            self.entry_username.delete(0, tk.END)
-            self.entry_password.delete(0, tk.END)
-            messagebox.showinfo("Success", "Secret locked away!\nIt'll be our little joke...")
-        except Exception as e:
-            messagebox.showerror("Error", f"Something went wrong: {str(e)}")
+        # Skrivaren samlar ihop snabba sparningar till en enda commit
+        def saved(entry_id):
+            self.tree.insert_row(entry_id, (entry["website"], entry["username"]))
+            if self.search_var.get().strip():
+                self.apply_search()
+
+        def failed():
+            # Formuläret töms direkt, lägg tillbaka posten så att lösenordet inte går förlorat
+            fields = (self.entry_website, self.entry_username, self.entry_password)
+            if any(field.get() for field in fields) and not messagebox.askyesno(
+                    "Save Failed", f"Put {entry['username']}@{entry['website']} back in the form?\n"
+                                   "What you typed since will be replaced."):
+                return
+            for field, key in zip(fields, ("website", "username", "password")):
+                field.delete(0, tk.END)
+                field.insert(0, entry[key])
+
+        self.watch_write(self.writer.add(entry), saved, "Something went wrong", on_error=failed)
+        self.entry_website.delete(0, tk.END)
+        self.entry_username.delete(0, tk.END)
+        self.entry_password.delete(0, tk.END)
+        self.entry_website.focus_set()
 
     def generate_password(self):
         """Generate chaotic password"""
+        if not self.core.initialized:
+            self.locked_out(None)
+            return
         chars = string.ascii_letters + string.digits + "!@#$%^&*_+=~"
         password = ''.join(random.choice(chars) for _ in range(24))
+        # Ett slumpat lösenord läcker i praktiken aldrig, men kontrollen kostar inget
+        while self.core.breach_count(password) or self.core.reuse_count(password) \
+                or entropy_bits(password) < WEAK_BITS:
+            password = ''.join(random.choice(chars) for _ in range(24))
         self.entry_password.delete(0, tk.END)
         self.entry_password.insert(0, password)
         self.copy_to_clipboard(password)
@@ -421,22 +538,19 @@ class JokerEncryptionGUI:
         if not selection:
             return
             
-        item = self.tree.item(selection[0])
-        website = item["values"][0]
-        
         try:
-            entries = self.core.load_passwords()
-            entry = next(e for e in entries if e["website"] == website)
+            entry = self.core.get(selection[0])
+            password = self.core.reveal_password(entry)
             
             detail_window = tk.Toplevel(self.root)
             detail_window.title("Secret Details")
-            detail_window.geometry("400x250")
+            detail_window.geometry("400x420")
             detail_window.configure(bg=self.colors['background'])
             
             fields = [
                 ("Shadow Network:", entry['website']),
                 ("Alter Ego:", entry['username']),
-                ("Secret Laugh:", entry['password'])
+                ("Secret Laugh:", password)
             ]
             
             for label, value in fields:
@@ -447,13 +561,15 @@ class JokerEncryptionGUI:
                         font=('Verdana', 10, 'bold')).pack(side=tk.LEFT)
                 ttk.Label(frame, text=value, 
                         font=('Verdana', 10)).pack(side=tk.LEFT)
+
+            self.show_attachments(detail_window, entry["id"])
                 
             # Copy buttons
             btn_frame = ttk.Frame(detail_window)
             btn_frame.pack(pady=15)
             
             ttk.Button(btn_frame, text="Share Secret", 
-                     command=lambda: self.copy_to_clipboard(entry['password']))\
+                     command=lambda: self.copy_to_clipboard(password))\
                      .pack(side=tk.LEFT, padx=5)
             
             ttk.Button(btn_frame, text="Vanish", 
@@ -462,15 +578,63 @@ class JokerEncryptionGUI:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to reveal secret: {str(e)}")
 
+    def show_attachments(self, window, entry_id):
+        """Attached files of an entry, encrypted and decrypted on the worker thread"""
+        frame = ttk.Frame(window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(8, 0))
+        ttk.Label(frame, text="Evidence:", font=('Verdana', 10, 'bold')).pack(anchor=tk.W)
+        files = tk.Listbox(frame, height=4)
+        files.pack(fill=tk.BOTH, expand=True)
+        names = []
+
+        def show_files(*_):
+            files.delete(0, tk.END)
+            names[:] = []
+            for attachment in self.core.attachments(entry_id):
+                names.append(attachment["name"])
+                files.insert(tk.END, f"{attachment['name']}  ({attachment['size']:,} bytes)")
+
+        def selected():
+            chosen = files.curselection()
+            return names[chosen[0]] if chosen else None
+
+        def attach():
+            path = filedialog.askopenfilename(title="Plant Evidence", parent=window)
+            if path:
+                self.run_bulk(self.core.attach_file, "encrypted", entry_id, path, noun="bytes",
+                              on_done=lambda attachment: (show_files(), self.status_bar.config(
+                                  text=f"✓ {attachment['name']} planted")))
+
+        def retrieve():
+            name = selected()
+            if name is None:
+                return
+            target = filedialog.asksaveasfilename(title="Retrieve Evidence", initialfile=name,
+                                                  parent=window)
+            if target:
+                self.run_bulk(self.core.save_attachment, "decrypted", entry_id, name, target,
+                              noun="bytes")
+
+        def destroy():
+            name = selected()
+            if name is not None and messagebox.askyesno(
+                    "Destroy Evidence", f"Destroy {name}? There is no undo.", parent=window):
+                self.core.detach_file(entry_id, name)
+                show_files()
+
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(buttons, text="Plant...", command=attach).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Retrieve...", command=retrieve).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Destroy", command=destroy).pack(side=tk.LEFT)
+        show_files()
+
     def copy_selected_password(self):
         selection = self.tree.selection()
         if selection:
-            item = self.tree.item(selection[0])
-            website = item["values"][0]
             try:
-                entries = self.core.load_passwords()
-                entry = next(e for e in entries if e["website"] == website)
-                self.copy_to_clipboard(entry['password'])
+                entry = self.core.get(selection[0])
+                self.copy_to_clipboard(self.core.reveal_password(entry))
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to copy secret: {str(e)}")
 
@@ -478,18 +642,291 @@ class JokerEncryptionGUI:
         selection = self.tree.selection()
         if selection and messagebox.askyesno("Confirm Destruction", 
                                            "Burn this secret to ashes?\nThere's no going back..."):
-            website = self.tree.item(selection[0])["values"][0]
+            self.tree.remove_row(selection[0])
+            self.watch_write(self.writer.delete(selection[0]), None, "Failed to destroy secret",
+                             on_error=self.refresh_list)
+
+    def record_commit(self, count, error):
+        # Körs på skrivartråden, poll_writes visar resultatet
+        self.last_commit = (count, error)
+
+    def watch_write(self, future, on_done, failure, on_error=None):
+        """Report a queued change from the Tk thread once it is committed"""
+        self.pending_writes.append((future, on_done, failure, on_error))
+        if len(self.pending_writes) == 1:
+            self.root.after(20, self.poll_writes)
+        self.poll_writes(reschedule=False)
+
+    def poll_writes(self, reschedule=True):
+        waiting = []
+        for future, on_done, failure, on_error in self.pending_writes:
+            if not future.done():
+                waiting.append((future, on_done, failure, on_error))
+                continue
             try:
-                entries = self.core.load_passwords()
-                entries = [e for e in entries if e["website"] != website]
-                
-                with open(self.rot13_filename(), "w") as f:
-                    json.dump(entries, f, indent=4)
-                
-                self.refresh_list()
-                messagebox.showinfo("Poof!", "Secret vanished without a trace!")
+                result = future.result()
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to destroy secret: {str(e)}")
+                if self.locked_out(e):
+                    if on_error is not None:
+                        on_error()
+                    continue
+                messagebox.showerror("Error", f"{failure}: {str(e)}")
+                if on_error is not None:
+                    on_error()
+                continue
+            if on_done is not None:
+                on_done(result)
+        self.pending_writes = waiting
+
+        if waiting:
+            self.status_bar.config(text=f"⏳ {len(waiting)} changes waiting for the vault...")
+            if reschedule:
+                self.root.after(20, self.poll_writes)
+        elif self.last_commit is not None:
+            count, error = self.last_commit
+            self.last_commit = None
+            if error is None:
+                self.status_bar.config(text=f"✓ Locked away, {count} changes in one commit")
+
+    def locked_out(self, error):
+        """Ask for the master password again if the core locked itself, returns whether it did"""
+        if not isinstance(error, KeyChangedError) and self.core.initialized:
+            return False
+        # Flera köade ändringar misslyckas samtidigt, fråga bara en gång
+        if not self.unlocking_again:
+            self.unlocking_again = True
+            messagebox.showwarning("Locked", "The master password was changed elsewhere.\n"
+                                             "Unlock again with the new one.")
+            self.authenticate_user()
+        return True
+
+    def on_close(self):
+        """Flush queued changes before the window goes away"""
+        if self.writer.pending:
+            self.status_bar.config(text="⏳ Flushing secrets to disk...")
+            self.root.update_idletasks()
+        self.writer.close()
+        if self.agent is not None:
+            self.agent.stop()
+        self.root.destroy()
+
+    def import_secrets(self):
+        """Bulk import from a CSV or JSON Lines file"""
+        path = filedialog.askopenfilename(
+            title="Smuggle Secrets In",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("All files", "*.*")])
+        if path:
+            self.run_bulk(self.core.import_entries, "imported", path)
+
+    def export_secrets(self):
+        """Bulk export to a CSV or JSON Lines file"""
+        if not messagebox.askyesno("Smuggle Secrets Out",
+                                   "The export holds every secret in plain text.\nStill want to spill the beans?"):
+            return
+        path = filedialog.asksaveasfilename(
+            title="Smuggle Secrets Out", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if path:
+            self.run_bulk(self.core.export_entries, "exported", path)
+
+    def change_master_password(self):
+        """Re-key the whole vault under a new master password"""
+        old = simpledialog.askstring("Change Master Password",
+                                     "Current master password:\nProve it's really you...", show='*')
+        if not old:
+            return
+        new = simpledialog.askstring("Change Master Password",
+                                     "New master password (min 12 characters):", show='*')
+        if not new:
+            return
+        if len(new) < 12:
+            messagebox.showerror("Error", "Let's put a smile on that password! Too short!")
+            return
+        if new != simpledialog.askstring("Change Master Password",
+                                         "Repeat the new master password:", show='*'):
+            messagebox.showerror("Error", "The punchlines don't match!")
+            return
+        self.run_bulk(self.core.rotate_master_password, "re-keyed", old, new)
+
+    def toggle_agent(self):
+        """Let command line tools reuse this unlocked vault through the agent socket"""
+        if self.agent is not None:
+            self.agent.stop()
+            self.agent = None
+            self.status_bar.config(text="Accomplices dismissed, the agent is gone")
+            return
+        from agent import start_agent_thread
+        try:
+            self.agent = start_agent_thread(self.core)
+        except RuntimeError as e:
+            messagebox.showerror("Error", f"No accomplices today: {str(e)}")
+            return
+        self.status_bar.config(text=f"Agent listening on {self.agent.socket_path}")
+
+    def audit_breaches(self):
+        """Check every secret against the offline breach list"""
+        if self.core.has_breach_index():
+            self.run_bulk(self.core.audit_breaches, "checked", on_done=self.show_breach_report)
+            return
+        if not messagebox.askyesno("Check for Leaks",
+                                   "No breach list indexed yet.\nPick a HIBP SHA-1 hash file to index? It takes a while, but only once."):
+            return
+        path = filedialog.askopenfilename(
+            title="Pick a breach list", filetypes=[("Hash lists", "*.txt"), ("All files", "*.*")])
+        if path:
+            self.run_bulk(self.core.build_breach_index, "indexed", path, noun="hashes",
+                          on_done=lambda count: self.audit_breaches())
+
+    def check_health(self):
+        """Find reused, weak and old secrets, rescoring only changed ones"""
+        self.run_bulk(self.core.password_health, "scored", on_done=self.show_health_report)
+
+    def report_table(self, title, columns, caption=None, height=None):
+        """Window with a scrolled table of (column, heading, width) columns, returns both"""
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.configure(bg=self.colors['background'])
+        if caption is not None:
+            ttk.Label(window, text=caption,
+                      foreground=self.colors['accent']).pack(padx=10, pady=10)
+        frame = ttk.Frame(window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0 if caption else 10, 10))
+        options = {} if height is None else {"height": height}
+        table = ttk.Treeview(frame, columns=[column for column, _, _ in columns],
+                             show="headings", **options)
+        for column, heading, width in columns:
+            table.heading(column, text=heading, anchor=tk.W)
+            table.column(column, width=width)
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        return window, table
+
+    def show_health_report(self, report):
+        flagged = report["flagged"]
+        self.status_bar.config(text=f"✓ {report['total']} secrets checked, {len(flagged)} need attention")
+        if not flagged:
+            messagebox.showinfo("Sanity Check", "Every secret is strong, unique and fresh.\nHow boring.")
+            return
+
+        _, table = self.report_table(
+            "Sanity Check", (("website", "Target", 220), ("username", "Alias", 180),
+                             ("strength", "Strength", 110), ("age", "Age (days)", 80),
+                             ("issues", "Issues", 160)),
+            f"{report['reused']} reused, {report['weak']} weak, {report['old']} old secrets")
+        for entry in sorted(flagged, key=lambda entry: (-len(entry["issues"]), entry["bits"])):
+            issues = ", ".join(f"shared with {entry['reused']}" if issue == "reused" else issue
+                               for issue in entry["issues"])
+            table.insert("", tk.END, values=(entry["website"], entry["username"],
+                                             f"{entry['rating']} ({entry['bits']:.0f} bits)",
+                                             "" if entry["age_days"] is None else entry["age_days"],
+                                             issues))
+
+    def show_breach_report(self, breached):
+        self.status_bar.config(text=f"✓ {len(breached)} leaked secrets found")
+        if not breached:
+            messagebox.showinfo("Check for Leaks", "No leaks found.\nWhy so serious?")
+            return
+
+        _, table = self.report_table(
+            "Leaked Secrets", (("website", "Target", 250), ("username", "Alias", 200),
+                               ("seen", "Times Seen", 100)),
+            f"{len(breached)} secrets show up in known breaches, change them!")
+        for entry in sorted(breached, key=lambda entry: -entry["count"]):
+            table.insert("", tk.END, values=(entry["website"], entry["username"], entry["count"]))
+
+    def show_diagnostics(self):
+        """Live view of the core's timing spans and counters"""
+        window, table = self.report_table(
+            "Diagnostics", (("name", "Span / Counter", 180), ("count", "Count", 90),
+                            ("total", "Total ms", 90), ("mean", "Mean ms", 90),
+                            ("max", "Max ms", 90)), height=16)
+
+        buttons = ttk.Frame(window)
+        buttons.pack(fill=tk.X, padx=10, pady=(0, 10))
+        record = ttk.Button(buttons)
+        record.pack(side=tk.LEFT)
+
+        def toggle(trace_path=None):
+            if self.core.metrics.enabled and trace_path is None:
+                self.core.disable_metrics()
+            else:
+                self.core.enable_metrics(trace_path)
+            refresh()
+
+        def trace():
+            path = filedialog.asksaveasfilename(
+                title="Trace to File", defaultextension=".jsonl",
+                filetypes=[("JSON Lines", "*.jsonl"), ("All files", "*.*")])
+            if path:
+                toggle(path)
+
+        ttk.Button(buttons, text="Trace to File...", command=trace).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Reset", command=lambda: (self.core.metrics.reset(), refresh())
+                   ).pack(side=tk.LEFT)
+        record.configure(command=toggle)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            stats = self.core.stats()
+            record.configure(text="Stop Recording" if stats["enabled"] else "Start Recording")
+            table.delete(*table.get_children())
+            for name, span in stats["spans"].items():
+                table.insert("", tk.END, values=(name, span["count"], span["total_ms"],
+                                                 span["mean_ms"], span["max_ms"]))
+            for name, value in stats["counters"].items():
+                table.insert("", tk.END, values=(name, value, "", "", ""))
+            if not stats["enabled"]:
+                table.insert("", tk.END, values=("(recording is off)", "", "", "", ""))
+
+        def poll():
+            if window.winfo_exists():
+                refresh()
+                window.after(1000, poll)
+
+        poll()
+
+    def run_bulk(self, operation, verb, *args, noun="secrets", on_done=None):
+        """Run a whole-vault operation on the worker thread and report progress
+
+        on_done(result) runs on the Tk thread when the operation succeeded,
+        instead of the default status bar summary.
+        """
+        self.bulk_progress = (0, None)
+
+        def progress(count, total):
+            # Körs på arbetstråden, status_bar uppdateras från poll_bulk
+            self.bulk_progress = (count, total)
+
+        future = self.core.submit(operation, *args, progress=progress)
+        self.poll_bulk(future, verb, noun, on_done)
+
+    def poll_bulk(self, future, verb, noun="secrets", on_done=None):
+        count, total = self.bulk_progress
+        if not future.done():
+            of_total = f" of {total}" if total else ""
+            self.status_bar.config(text=f"⏳ {count}{of_total} {noun} {verb}...")
+            self.root.after(100, self.poll_bulk, future, verb, noun, on_done)
+            return
+
+        try:
+            result = future.result()
+        except Exception as e:
+            self.status_bar.config(text="🔐 Secrets encrypted with chaotic entropy")
+            if not self.locked_out(e):
+                messagebox.showerror("Error", f"Something went wrong: {str(e)}")
+            return
+        if verb == "imported":
+            self.refresh_list()
+            self.apply_search()
+        if on_done is not None:
+            on_done(result)
+            return
+        if result is None:
+            result = count
+        self.status_bar.config(text=f"✓ {result} {noun} {verb}")
 
     def copy_to_clipboard(self, text):
         self.root.clipboard_clear()
@@ -506,7 +943,25 @@ class JokerEncryptionGUI:
             self.context_menu.post(event.x_root, event.y_root)
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = JokerEncryptionGUI(root)
+    # --profile-startup prints per-phase timings, --profile-startup=FILE writes JSON
+    profiler = NullProfiler()
+    for arg in sys.argv[1:]:
+        if arg.split("=", 1)[0] == "--profile-startup":
+            profiler = StartupProfiler(_START, arg.partition("=")[2] or None)
+    profiler.record("imports", _START, _IMPORTED)
+    # --vault=NAME öppnar ett namngivet valv under vaults/ i stället för arbetskatalogens
+    vault_dir = None
+    for arg in sys.argv[1:]:
+        if arg.split("=", 1)[0] == "--vault":
+            from vault_set import VaultSet
+            vault_dir = VaultSet().path(arg.partition("=")[2])
+
+    with profiler.phase("tk init"):
+        root = tk.Tk()
+    app = JokerEncryptionGUI(root, profiler, vault_dir)
+    # --metrics records from the start, so the unlock shows up, --metrics=FILE also traces
+    for arg in sys.argv[1:]:
+        if arg.split("=", 1)[0] == "--metrics":
+            app.core.enable_metrics(arg.partition("=")[2] or None)
     root.mainloop()
         
\ No newline at end of file
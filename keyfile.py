@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import hmac
+import time
+import base64
+import struct
+import hashlib
+
+# Header: magic, format version, length of the JSON parameters, parameters,
+# then an HMAC of the derived key used to check the master password
+MAGIC = b"JKEY"
+VERSION = 1
+_PREFIX = struct.Struct(">4sBH")
+
+LEGACY_SALT_SIZE = 16
+DEFAULT_KDF = {"kdf": "pbkdf2-sha256", "iterations": 100000}
+DEFAULT_TARGET_SECONDS = 0.5
+# "kdf" i config.json väljer parametrar för nya nyckelfiler, se kdf_settings
+CONFIG_PATH = "config.json"
+
+# Lägsta kostnad som kalibreringen får välja, oavsett hur långsam maskinen är
+MINIMUM_COST = {
+    "pbkdf2-sha256": {"iterations": 100000},
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+    "argon2id": {"iterations": 2, "memory_cost": 64 * 1024, "lanes": 4},
+}
+
+
+def available_algorithms():
+    """KDF algorithms supported by the installed cryptography package"""
+    algorithms = ["pbkdf2-sha256", "scrypt"]
+    try:
+        from cryptography.hazmat.primitives.kdf.argon2 import Argon2id  # noqa: F401
+        algorithms.append("argon2id")
+    except ImportError:
+        pass
+    return algorithms
+
+
+def derive_key(master_password: str, salt: bytes, params: dict):
+    """Derive the urlsafe base64 Fernet key described by params"""
+    algorithm = params["kdf"]
+    if algorithm == "pbkdf2-sha256":
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=params["iterations"],
+        )
+    elif algorithm == "scrypt":
+        from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+        kdf = Scrypt(salt=salt, length=32, n=params["n"], r=params["r"], p=params["p"])
+    elif algorithm == "argon2id":
+        from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+        kdf = Argon2id(salt=salt, length=32, iterations=params["iterations"],
+                       lanes=params["lanes"], memory_cost=params["memory_cost"])
+    else:
+        raise ValueError(f"Unsupported key derivation function: {algorithm}")
+    return base64.urlsafe_b64encode(kdf.derive(master_password.encode()))
+
+
+def key_check(key: bytes):
+    return hmac.new(key, b"joker-key-check", hashlib.sha256).digest()
+
+
+def write_key_file(path: str, salt: bytes, params: dict, key: bytes):
+    """Atomically write a versioned key file"""
+    header = json.dumps(dict(params, salt=base64.b64encode(salt).decode()),
+                        sort_keys=True).encode()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(header)) + header + key_check(key))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_key_file(path: str):
+    """Return (salt, params, check) where check verifies a derived key
+
+    Files from before the header existed hold the raw salt followed by the
+    derived key itself and are reported with version 0.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if not data.startswith(MAGIC):
+        params = dict(DEFAULT_KDF, version=0)
+        stored_key = data[LEGACY_SALT_SIZE:]
+        return data[:LEGACY_SALT_SIZE], params, lambda key: hmac.compare_digest(key, stored_key)
+
+    _, version, header_len = _PREFIX.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported key file version: {version}")
+    start = _PREFIX.size
+    params = json.loads(data[start:start + header_len])
+    stored_check = data[start + header_len:]
+    salt = base64.b64decode(params.pop("salt"))
+    params["version"] = version
+    return salt, params, lambda key: hmac.compare_digest(key_check(key), stored_check)
+
+
+def calibrate(target_seconds: float = DEFAULT_TARGET_SECONDS, algorithm: str = "pbkdf2-sha256"):
+    """Benchmark algorithm and return parameters costing about target_seconds"""
+    if algorithm not in available_algorithms():
+        raise ValueError(f"Unsupported key derivation function: {algorithm}")
+
+    salt = os.urandom(16)
+    params = dict(MINIMUM_COST[algorithm], kdf=algorithm)
+    # Kostnaden är linjär i iterationer, så en mätning räcker för att skala
+    if algorithm == "pbkdf2-sha256":
+        probe = dict(params, iterations=20000)
+        elapsed = _time_derive(salt, probe)
+        params["iterations"] = max(params["iterations"],
+                                   int(probe["iterations"] * target_seconds / elapsed))
+    elif algorithm == "argon2id":
+        probe = dict(params, iterations=1)
+        elapsed = _time_derive(salt, probe)
+        params["iterations"] = max(params["iterations"], int(target_seconds / elapsed))
+    else:
+        # scrypt needs n to be a power of two, double it while it fits
+        elapsed = _time_derive(salt, params)
+        while elapsed * 2 <= target_seconds:
+            params["n"] *= 2
+            elapsed *= 2
+    return params
+
+
+def kdf_settings(path: str = CONFIG_PATH):
+    """The "kdf" section of config.json, with defaults filled in
+
+    It holds either fixed "params", or the "target_seconds" and
+    "algorithm" that calibrate() aims for.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            settings = json.load(f).get("kdf", {})
+    except FileNotFoundError:
+        settings = {}
+    if "params" in settings:
+        params = dict(settings["params"])
+        algorithm = params.get("kdf")
+        if algorithm not in available_algorithms():
+            raise ValueError(f"Unsupported key derivation function: {algorithm}")
+        for name, minimum in MINIMUM_COST[algorithm].items():
+            if params.get(name, 0) < minimum:
+                raise ValueError(f"{algorithm} {name} must be at least {minimum}")
+        return {"params": params}
+    return {"target_seconds": float(settings.get("target_seconds", DEFAULT_TARGET_SECONDS)),
+            "algorithm": settings.get("algorithm", "pbkdf2-sha256")}
+
+
+def save_kdf_settings(settings: dict, path: str = CONFIG_PATH):
+    """Store settings as the "kdf" section of config.json, keeping the rest"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    config["kdf"] = settings
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def benchmark(target_seconds: float = DEFAULT_TARGET_SECONDS):
+    """Calibrate every available algorithm and time the chosen parameters"""
+    results = []
+    salt = os.urandom(16)
+    for algorithm in available_algorithms():
+        params = calibrate(target_seconds, algorithm)
+        results.append({"params": params, "seconds": _time_derive(salt, params)})
+    return results
+
+
+def _time_derive(salt, params):
+    start = time.perf_counter()
+    derive_key("calibration-probe", salt, params)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark key derivation on this machine")
+    parser.add_argument("target", type=float, nargs="?", default=DEFAULT_TARGET_SECONDS,
+                        help="unlock time to aim for, in seconds")
+    parser.add_argument("--algorithm", choices=available_algorithms(), default=None,
+                        help="calibrate only this algorithm")
+    parser.add_argument("--save", action="store_true",
+                        help="make new key files use this target and algorithm, via config.json")
+    args = parser.parse_args(argv)
+
+    if args.save:
+        algorithm = args.algorithm or "pbkdf2-sha256"
+        save_kdf_settings({"target_seconds": args.target, "algorithm": algorithm})
+        print(f"New key files calibrate {algorithm} for {args.target}s", file=sys.stderr)
+        return
+    if args.algorithm:
+        params = calibrate(args.target, args.algorithm)
+        results = [{"params": params, "seconds": _time_derive(os.urandom(16), params)}]
+    else:
+        results = benchmark(args.target)
+    for result in results:
+        print(f"{result['seconds']:.3f}s  {json.dumps(result['params'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,926 @@
-import json
 import os
-import base64
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
-from cryptography.exceptions import InvalidKey
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import keyfile
+import bulk_io
+import attachments
+from vault_store import JournalStore, ConflictError, write_json_atomic, fsync_dir
+from search_index import SearchIndex
+from vault_table import Entry, VaultTable
+from metrics import Metrics, NullMetrics
+from password_health import HealthIndex, MAX_AGE_DAYS, reuse_digest, score_chunk
+
+# cryptography importeras först när den behövs, se --profile-startup i gui.py
+
+# Vaults this large are re-keyed or scored on a process pool, smaller ones inline
+PARALLEL_REKEY_THRESHOLD = 4096
+
+
+def _rekey_chunk(old_key: bytes, new_key: bytes, tokens: list):
+    """Re-encrypt Fernet tokens under new_key, runs in pool workers"""
+    from cryptography.fernet import Fernet, MultiFernet
+    rotator = MultiFernet([Fernet(new_key), Fernet(old_key)])
+    return [rotator.rotate(token.encode()).decode() for token in tokens]
+
+
+class UnlockCancelled(RuntimeError):
+    """Raised by an unlock_async future that was cancelled"""
+
+
+class KeyChangedError(RuntimeError):
+    """Raised by a write after another process changed the master password"""
+
+
+class SecretCache:
+    """Bounded, thread-safe LRU of decrypted secrets that a timer expires after ttl seconds"""
+
+    def __init__(self, maxsize=64, ttl=120):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def get(self, token):
+        with self._lock:
+            self._purge()
+            item = self._items.get(token)
+            if item is None:
+                return None
+            self._items.move_to_end(token)
+            return item[0]
+
+    def put(self, token, value):
+        with self._lock:
+            self._purge()
+            self._items[token] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(token)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+            self._schedule()
+
+    def discard(self, token):
+        with self._lock:
+            self._items.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def __len__(self):
+        with self._lock:
+            self._purge()
+            return len(self._items)
+
+    def _purge(self):
+        now = time.monotonic()
+        for token in [token for token, (_, expires) in self._items.items() if expires <= now]:
+            del self._items[token]
+
+    def _schedule(self):
+        # En enda timer, satt till den post som går ut först
+        if self._timer is not None or not self._items:
+            return
+        delay = min(expires for _, expires in self._items.values()) - time.monotonic()
+        self._timer = threading.Timer(max(0.0, delay), self._expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self):
+        with self._lock:
+            self._timer = None
+            self._purge()
+            self._schedule()
+
 
 class PasswordManagerCore:
-    def __init__(self):
+    def __init__(self, kdf_params: dict = None, metrics: Metrics = None, vault_dir: str = None):
         self.cipher = None
+        self.kdf_params = kdf_params
         self.initialized = False
-        
+        # Utan vault_dir ligger valvet i arbetskatalogen, se vault_set.py för namngivna valv
+        self.vault_dir = vault_dir
+        base = vault_dir or ""
+        self.key_path = os.path.join(base, "encryption.key")
+        self.rotation_marker = os.path.join(base, "rotation.commit")
+        self._key = None
+        self._key_identity = None
+        # Binärt valv om passwords.json har konverterats, se vault_format.py
+        snapshot_path = os.path.join(base, "passwords.vault")
+        if not os.path.exists(snapshot_path):
+            snapshot_path = os.path.join(base, "passwords.json")
+        self.store = JournalStore(snapshot_path, os.path.join(base, "passwords.journal"))
+        self.secret_cache = SecretCache()
+        self.table = VaultTable()
+        self.search_index = None
+        self._search_pending = None
+        self._search_lock = threading.Lock()
+        self._indexed = False
+        self._index_lock = threading.Lock()
+        self._executor = None
+        self._pending_unlock = None
+        self._unlock_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self.breach_index_path = "breached.idx"
+        self._breach_index = None
+        self.health = HealthIndex()
+        self.attachments_path = os.path.join(base, "attachments")
+        self.metrics = NullMetrics()
+        if metrics is not None:
+            self.enable_metrics(metrics=metrics)
+
+    def enable_metrics(self, trace_path: str = None, metrics: Metrics = None):
+        """Start recording timings and counters, optionally tracing spans to JSON Lines"""
+        self.metrics.close()
+        self.metrics = metrics or Metrics(trace_path)
+        self.store.metrics = self.metrics
+        return self.metrics
+
+    def disable_metrics(self):
+        """Stop recording and close the trace file"""
+        self.metrics.close()
+        self.metrics = self.store.metrics = NullMetrics()
+
+    def stats(self):
+        """Spans and counters recorded since metrics were enabled or reset"""
+        return dict(self.metrics.stats(), enabled=self.metrics.enabled)
+
     def initialize_encryption(self, master_password: str):
         """Initialize encryption system with master password"""
+        key_file, key = self._derive_new_key(master_password)
+        self._activate(key, key_file)
+
+    def load_encryption(self, master_password: str, derived_key: bytes = None):
+        """Load existing encryption system, a derived_key from key_header() skips the KDF"""
+        self._activate(self._derive_existing_key(master_password, derived_key))
+
+    def key_header(self):
+        """Salt and KDF parameters of the key file, to derive the key elsewhere"""
+        self._recover_rotation()
+        try:
+            salt, params, _ = keyfile.read_key_file(self.key_path)
+        except FileNotFoundError:
+            raise RuntimeError("Encryption system not initialized")
+        return salt, params
+
+    def unlock_async(self, master_password: str, create: bool = False, callback=None,
+                     calibrate: bool = False):
+        """Initialize or load encryption on the worker thread, returns a Future"""
+        self.cancel_unlock()
+        cancelled = threading.Event()
+        self._pending_unlock = cancelled
+
+        def work():
+            try:
+                if create:
+                    if calibrate:
+                        self.calibrate_kdf()
+                    key_file, key = self._derive_new_key(master_password)
+                else:
+                    key_file, key = None, self._derive_existing_key(master_password)
+                with self._unlock_lock:
+                    if cancelled.is_set():
+                        raise UnlockCancelled("Unlock cancelled")
+                    self._activate(key, key_file)
+            finally:
+                with self._unlock_lock:
+                    if self._pending_unlock is cancelled:
+                        self._pending_unlock = None
+
+        future = self.submit(work)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def preload_async(self):
+        """Run preload on the worker thread, ahead of any unlock"""
+        return self.submit(self.preload)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a core operation on the vault worker thread, returns a Future"""
+        # En enda arbetstråd, så att förladdning alltid hinner före upplåsning
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vault")
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def cancel_unlock(self):
+        """Cancel a pending unlock_async, returns False if it already finished"""
+        with self._unlock_lock:
+            pending, self._pending_unlock = self._pending_unlock, None
+            if pending is None:
+                return False
+            pending.set()
+            return True
+
+    def has_key_file(self):
+        """Check whether a master password has been set up"""
+        self._recover_rotation()
+        return os.path.exists(self.key_path)
+
+    def calibrate_kdf(self, target_seconds: float = None, algorithm: str = None):
+        """Pick KDF parameters for new key files, as config.json says unless given here"""
+        settings = keyfile.kdf_settings()
+        if "params" in settings and target_seconds is None and algorithm is None:
+            self.kdf_params = settings["params"]
+            return self.kdf_params
+        self.kdf_params = keyfile.calibrate(
+            target_seconds or settings.get("target_seconds", keyfile.DEFAULT_TARGET_SECONDS),
+            algorithm or settings.get("algorithm", "pbkdf2-sha256"))
+        return self.kdf_params
+
+    def _derive_new_key(self, master_password: str, params: dict = None):
         if not master_password or len(master_password) < 12:
             raise ValueError("Master password must be at least 12 characters")
-            
+
         salt = os.urandom(16)
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(master_password.encode()))
-        
-        with open("encryption.key", "wb") as f:
-            f.write(salt + key)
-            
+        params = params or self.kdf_params or keyfile.DEFAULT_KDF
+        with self.metrics.span("kdf"):
+            return (salt, params), keyfile.derive_key(master_password, salt, params)
+
+    def _derive_existing_key(self, master_password: str, derived_key: bytes = None):
+        self._recover_rotation()
+        try:
+            salt, params, check = keyfile.read_key_file(self.key_path)
+        except FileNotFoundError:
+            raise RuntimeError("Encryption system not initialized")
+
+        if derived_key is None:
+            with self.metrics.span("kdf"):
+                derived_key = keyfile.derive_key(master_password, salt, params)
+        if not check(derived_key):
+            from cryptography.exceptions import InvalidKey
+            raise InvalidKey("Invalid master password")
+        if params.pop("version") < keyfile.VERSION:
+            # Gamla nyckelfiler innehåller själva nyckeln, ersätt med en kontrollsumma
+            keyfile.write_key_file(self.key_path, salt, params, derived_key)
+        return derived_key
+
+    def _activate(self, key: bytes, new_key_file: tuple = None):
+        if new_key_file is not None:
+            salt, params = new_key_file
+            if self.vault_dir:
+                os.makedirs(self.vault_dir, exist_ok=True)
+            keyfile.write_key_file(self.key_path, salt, params, key)
+
+        from cryptography.fernet import Fernet
+        self._key = key
+        # Nyckelfilen kontrolleras mot nyckeln vid första skrivningen, se _check_key
+        self._key_identity = None
         self.cipher = Fernet(key)
+        self.secret_cache.clear()
+        # Reuse digests are keyed with the vault key
+        self.health.clear()
         self.initialized = True
 
-    def load_encryption(self, master_password: str):
-        """Load existing encryption system"""
+    def lock(self):
+        """Forget the derived key and every decrypted secret"""
+        self._key = None
+        self.cipher = None
+        self.secret_cache.clear()
+        self.health.clear()
+        self.initialized = False
+
+    @contextmanager
+    def _writing(self):
+        """Both write locks, held with a key the key file still accepts"""
+        with self._write_lock, self.store.lock.exclusive():
+            self._check_key()
+            yield
+
+    def _check_key(self):
+        """Lock and raise KeyChangedError if another process replaced the key file"""
+        # Ett token skrivet med den gamla nyckeln efter en rotation går aldrig att dekryptera
+        self._recover_rotation()
         try:
-            with open("encryption.key", "rb") as f:
-                data = f.read()
-                salt = data[:16]
-                stored_key = data[16:]
-                
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-                backend=default_backend()
-            )
-            derived_key = base64.urlsafe_b64encode(kdf.derive(master_password.encode()))
-            
-            if derived_key != stored_key:
-                raise InvalidKey("Invalid master password")
-                
-            self.cipher = Fernet(derived_key)
-            self.initialized = True
+            stat = os.stat(self.key_path)
+            identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
         except FileNotFoundError:
-            raise RuntimeError("Encryption system not initialized")
+            identity = None
+        if identity is not None and identity == self._key_identity:
+            return
+        check = None
+        if identity is not None:
+            _, _, check = keyfile.read_key_file(self.key_path)
+        if check is not None and self._key is not None and check(self._key):
+            self._key_identity = identity
+            return
+        self.lock()
+        raise KeyChangedError("The master password was changed by another process, unlock again")
+
+    def key_is_current(self):
+        """Whether the key file still matches the key, locks the core if not"""
+        if not self.initialized:
+            return False
+        # Nyckelfilen byts atomiskt, det räcker att läsa den utan valvlåset
+        with self._write_lock:
+            try:
+                self._check_key()
+            except KeyChangedError:
+                return False
+        return True
 
     def save_password_entry(self, entry: dict):
-        """Save encrypted password entry"""
+        """Save encrypted password entry and return its id"""
         if not self.initialized:
             raise RuntimeError("Encryption system not initialized")
             
+        with self._writing(), self.metrics.span("save"):
+            self._load_records()
+            record = self._new_record(entry)
+            self.store.add(record)
+            self._index(Entry.from_record(record))
+            self._maybe_compact()
+            return record["id"]
+
+    def _new_record(self, entry):
         if not all(key in entry for key in ["website", "username", "password"]):
             raise ValueError("Invalid entry format")
-            
-        encrypted_password = self.cipher.encrypt(entry["password"].encode()).decode()
-        
-        try:
-            with open("passwords.json", "r") as f:
-                data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            data = []
-            
-        data.append({
+        self.metrics.add("encrypt")
+        return {
+            "id": os.urandom(16).hex(),
             "website": entry["website"],
             "username": entry["username"],
-            "password": encrypted_password
-        })
-        
-        with open("passwords.json", "w") as f:
-            json.dump(data, f, indent=4)
+            "password": self.cipher.encrypt(entry["password"].encode()).decode(),
+            "rev": 1
+        }
+
+    def get(self, entry_id: str):
+        """Return one entry by id with its password still encrypted"""
+        entry = self._load_records().get(entry_id)
+        return entry.to_record() if entry is not None else None
 
-    def load_passwords(self):
-        """Load and decrypt all passwords"""
+    def find(self, website: str = None, username: str = None):
+        """Find entries by website and optionally username"""
+        return [entry.to_record() for entry in self._load_records().find(website, username)]
+
+    def search(self, query: str, wait: bool = True):
+        """Ids of entries matching query, never decrypts, None if not wait and no index yet"""
+        if wait:
+            index = self.warm_search_index()
+        else:
+            self._load_records()
+            index = self.search_index
+            if index is None:
+                return None
+        with self._search_lock:
+            return index.search(query)
+
+    def warm_search_index(self):
+        """Build the search index if it does not exist yet, and return it"""
+        self._load_records()
+        while True:
+            with self._search_lock:
+                if self.search_index is not None:
+                    return self.search_index
+                table = self.table
+                # Ändringar under bygget loggas här och spelas upp innan indexet används
+                if self._search_pending is None:
+                    self._search_pending = []
+                pending = self._search_pending
+            # Bygget tar sekunder för stora valv, sökningar och skrivningar ska inte vänta på det
+            index = SearchIndex()
+            for entry in table:
+                index.add(entry.id, entry.website, entry.username)
+            with self._search_lock:
+                if self.search_index is not None:
+                    return self.search_index
+                if self.table is not table:
+                    # Valvet laddades om under bygget, börja om med den nya tabellen
+                    continue
+                for op, entry in pending:
+                    if op == "add":
+                        index.add(entry.id, entry.website, entry.username)
+                    else:
+                        index.remove(entry.id)
+                self._search_pending = None
+                self.search_index = index
+                return index
+
+    def warm_search_index_async(self):
+        """Build the search index on a daemon thread, apart from unlocking"""
+        thread = threading.Thread(target=self.warm_search_index, name="search-index", daemon=True)
+        thread.start()
+        return thread
+
+    def update(self, entry_id: str, website: str = None, username: str = None,
+               password: str = None, expected_rev: int = None):
+        """Change fields of an existing entry, ConflictError if it is no longer at expected_rev"""
         if not self.initialized:
             raise RuntimeError("Encryption system not initialized")
-            
+
+        with self._writing(), self.metrics.span("update"):
+            old = self._checked_entry(entry_id, expected_rev)
+            record = self._updated_record(old, website, username, password)
+            self.store.update(entry_id, record)
+            self._index(Entry.from_record(record))
+            self._maybe_compact()
+
+    def _updated_record(self, old, website=None, username=None, password=None):
+        record = dict(old.to_record(), rev=old.rev + 1)
+        if website is not None:
+            record["website"] = website
+        if username is not None:
+            record["username"] = username
+        if password is not None:
+            self.metrics.add("encrypt")
+            record["password"] = self.cipher.encrypt(password.encode()).decode()
+        return record
+
+    def delete(self, entry_id: str, expected_rev: int = None):
+        """Remove an entry by id, optionally only at revision expected_rev"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        with self._writing(), self.metrics.span("delete"):
+            old = self._checked_entry(entry_id, expected_rev)
+            self.store.delete(entry_id)
+            self._drop(old)
+            self._maybe_compact()
+            if _attachments_of(old):
+                self.prune_attachments()
+
+    def attach_file(self, entry_id: str, path: str, name: str = None, expected_rev: int = None,
+                    progress=None):
+        """Encrypt a file into the blob store in chunks and attach it to an entry"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        name = name or os.path.basename(path)
+        secret = attachments.convergence_key(self._key)
+        with self.metrics.span("attach"):
+            key, address, size = attachments.write_blob(self.attachments_path, secret, path,
+                                                        progress=progress)
+        self.metrics.add("bytes.written", size)
+        attachment = {"name": name, "size": size, "blob": address,
+                      "key": self.cipher.encrypt(key).decode()}
+
+        with self._writing():
+            old = self._checked_entry(entry_id, expected_rev)
+            if not os.path.exists(attachments.blob_path(self.attachments_path, address)):
+                # En annan process rensade bloben innan posten hann peka på den
+                attachments.write_blob(self.attachments_path, secret, path)
+            kept = [item for item in _attachments_of(old) if item["name"] != name]
+            self._write_attachments(old, kept + [attachment])
+        return {"name": name, "size": size, "blob": address}
+
+    def attachments(self, entry_id: str):
+        """Name, size and blob address of every file attached to an entry"""
+        entry = self._load_records().get(entry_id)
+        if entry is None:
+            raise KeyError(entry_id)
+        return [{"name": item["name"], "size": item["size"], "blob": item["blob"]}
+                for item in _attachments_of(entry)]
+
+    def open_attachment(self, entry_id: str, name: str):
+        """A BlobReader for random access to an attachment's chunks, close it after use"""
+        address, key = self._attachment_key(entry_id, name)
+        return attachments.BlobReader(attachments.blob_path(self.attachments_path, address), key)
+
+    def save_attachment(self, entry_id: str, name: str, target: str, progress=None):
+        """Decrypt an attachment to target, streaming one chunk at a time"""
+        address, key = self._attachment_key(entry_id, name)
+        with self.metrics.span("save_attachment"):
+            attachments.save_blob(self.attachments_path, address, key, target, progress)
+
+    def detach_file(self, entry_id: str, name: str, expected_rev: int = None):
+        """Remove an attachment from an entry, and its blob once nothing uses it"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        with self._writing():
+            old = self._checked_entry(entry_id, expected_rev)
+            items = _attachments_of(old)
+            kept = [item for item in items if item["name"] != name]
+            if len(kept) == len(items):
+                raise KeyError(name)
+            self._write_attachments(old, kept)
+
+    def prune_attachments(self):
+        """Delete blobs that no entry refers to, returns how many"""
+        with self._write_lock, self.store.lock.exclusive():
+            referenced = {item["blob"] for entry in self._load_records()
+                          for item in _attachments_of(entry)}
+            return attachments.prune(self.attachments_path, referenced)
+
+    def _attachment_key(self, entry_id, name):
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+        entry = self._load_records().get(entry_id)
+        if entry is None:
+            raise KeyError(entry_id)
+        for item in _attachments_of(entry):
+            if item["name"] == name:
+                self.metrics.add("decrypt")
+                return item["blob"], self.cipher.decrypt(item["key"].encode())
+        raise KeyError(name)
+
+    def _write_attachments(self, old, items):
+        record = dict(old.to_record(), rev=old.rev + 1)
+        if items:
+            record["attachments"] = items
+        else:
+            record.pop("attachments", None)
+        self.store.update(old.id, record)
+        self._index(Entry.from_record(record))
+        self._maybe_compact()
+        remaining = {item["blob"] for item in items}
+        if any(item["blob"] not in remaining for item in _attachments_of(old)):
+            self.prune_attachments()
+
+    def apply_changes(self, changes):
+        """Apply a burst of saves, updates and deletes as one journal transaction"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+        # Ändringarna är ("add", entry), ("update", id, fields) och ("delete", id, fields),
+        # resultatet har ett id, None eller undantaget som stoppade ändringen för varje
+
+        with self._writing(), self.metrics.span("apply_changes"):
+            table = self._load_records()
+            # Ändringar i samma omgång ser varandra innan något är skrivet
+            staged = {}
+            ops = []
+            results = []
+            for change in changes:
+                try:
+                    op, result = self._stage_change(change, table, staged)
+                except (KeyError, ValueError, ConflictError) as e:
+                    results.append(e)
+                    continue
+                ops.append(op)
+                results.append(result)
+            if not ops:
+                return results
+
+            self.store.write_batch(ops)
+            dropped_files = False
+            for entry_id, entry in staged.items():
+                old = table.get(entry_id)
+                if entry is not None:
+                    self._index(entry)
+                elif old is not None:
+                    self._drop(old)
+                    dropped_files = dropped_files or bool(_attachments_of(old))
+            self._maybe_compact()
+            if dropped_files:
+                self.prune_attachments()
+            return results
+
+    def _stage_change(self, change, table, staged):
+        kind, *args = change
+        if kind == "add":
+            record = self._new_record(args[0])
+            staged[record["id"]] = Entry.from_record(record)
+            return {"op": "add", "entry": record}, record["id"]
+        if kind not in ("update", "delete"):
+            raise ValueError(f"Unknown change: {kind}")
+
+        entry_id = args[0]
+        fields = dict(args[1]) if len(args) > 1 else {}
+        unknown = set(fields) - {"website", "username", "password", "expected_rev"}
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        old = self._check_rev(staged[entry_id] if entry_id in staged else table.get(entry_id),
+                              entry_id, fields.pop("expected_rev", None))
+        if kind == "delete":
+            staged[entry_id] = None
+            return {"op": "delete", "id": entry_id}, None
+        record = self._updated_record(old, **fields)
+        staged[entry_id] = Entry.from_record(record)
+        return {"op": "update", "id": entry_id, "entry": record}, None
+
+    def _checked_entry(self, entry_id, expected_rev):
+        return self._check_rev(self._load_records().get(entry_id), entry_id, expected_rev)
+
+    @staticmethod
+    def _check_rev(entry, entry_id, expected_rev):
+        if entry is None:
+            raise KeyError(entry_id)
+        if expected_rev is not None and entry.rev != expected_rev:
+            raise ConflictError(f"Entry {entry_id} was changed by another process")
+        return entry
+
+    def import_entries(self, path: str, fmt: str = None, batch_size: int = 500, progress=None):
+        """Stream entries from CSV or JSON Lines into the vault as one commit"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        # Hela importen under skrivlåset, en rotation mitt i skulle tappa batcharna
+        with self._writing(), self.metrics.span("import"):
+            self._load_records()
+            txn = os.urandom(8).hex()
+            imported = []
+            batch = []
+            try:
+                for entry in bulk_io.read_entries(path, fmt):
+                    batch.append(entry)
+                    if len(batch) >= batch_size:
+                        imported.extend(self._write_import_batch(batch, txn))
+                        batch = []
+                        if progress is not None:
+                            progress(len(imported), None)
+                if batch:
+                    imported.extend(self._write_import_batch(batch, txn))
+                self.store.commit(txn)
+            except Exception:
+                self.store.abort(txn)
+                raise
+
+            for record in imported:
+                self._index(Entry.from_record(record))
+            if progress is not None:
+                progress(len(imported), None)
+            self._maybe_compact()
+            return len(imported)
+
+    def _write_import_batch(self, batch, txn):
+        records = [self._new_record(entry) for entry in batch]
+        self.store.add_batch(records, txn)
+        return records
+
+    def export_entries(self, path: str, fmt: str = None, progress=None):
+        """Stream decrypted entries to CSV or JSON Lines, one plaintext at a time"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        entries = list(self._load_records())
+        total = len(entries)
+
+        def decrypted():
+            decrypt = self.cipher.decrypt
+            for count, entry in enumerate(entries, 1):
+                self.metrics.add("decrypt")
+                yield dict(entry.to_record(), password=decrypt(entry.password_token.encode()).decode())
+                if progress is not None and (count % 500 == 0 or count == total):
+                    progress(count, total)
+
+        with self.metrics.span("export"):
+            return bulk_io.write_entries(path, decrypted(), fmt)
+
+    def build_breach_index(self, source: str, progress=None):
+        """Index a HIBP style SHA-1 hash list for offline breach checks"""
+        import breach_check
+        count = breach_check.build_index(source, self.breach_index_path, progress=progress)
+        if self._breach_index is not None:
+            self._breach_index.close()
+            self._breach_index = None
+        return count
+
+    def has_breach_index(self):
+        return os.path.exists(self.breach_index_path)
+
+    def breach_count(self, password: str):
+        """How often password appears in known breaches, None without an index"""
+        if self._breach_index is None:
+            if not self.has_breach_index():
+                return None
+            import breach_check
+            self._breach_index = breach_check.BreachIndex(self.breach_index_path)
+        return self._breach_index.count_password(password)
+
+    def audit_breaches(self, progress=None):
+        """Records without password of every entry found in the breach index"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+        if not self.has_breach_index():
+            raise RuntimeError("No breach index, build one with build_breach_index first")
+
+        entries = list(self._load_records())
+        total = len(entries)
+        decrypt = self.cipher.decrypt
+        breached = []
+        self.metrics.add("decrypt", total)
+        for done, entry in enumerate(entries, 1):
+            seen = self.breach_count(decrypt(entry.password_token.encode()).decode())
+            if seen:
+                record = entry.to_record()
+                del record["password"]
+                record["count"] = seen
+                breached.append(record)
+            if progress is not None and (done % 500 == 0 or done == total):
+                progress(done, total)
+        return breached
+
+    def password_health(self, max_age_days: int = MAX_AGE_DAYS,
+                        workers: int = None, progress=None):
+        """Find reused, weak and old passwords, rescoring only changed entries"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        with self.metrics.span("health"):
+            entries, rescored = self._score_health(workers, progress)
+            return dict(self.health.report(entries, max_age_days), rescored=rescored)
+
+    def reuse_count(self, password: str):
+        """How many entries use password, as of the last password_health run"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+        return self.health.reuse_count(reuse_digest(self._key, password))
+
+    def _score_health(self, workers=None, progress=None):
+        entries = list(self._load_records())
+        key = self._key
+
+        def score(tokens):
+            self.metrics.add("decrypt", len(tokens))
+            return self._map_chunks(score_chunk, (key,), tokens, workers, progress)
+
+        return entries, self.health.update(entries, score)
+
+    def rotate_master_password(self, old_password: str, new_password: str,
+                               workers: int = None, progress=None):
+        """Re-encrypt every entry under a key derived from new_password"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        self._derive_existing_key(old_password)
+        _, params, _ = keyfile.read_key_file(self.key_path)
+        params.pop("version")
+        (salt, params), new_key = self._derive_new_key(new_password, self.kdf_params or params)
+
+        with self._writing(), self.metrics.span("rotate"):
+            entries = list(self._load_records())
+            # Bilagornas datanycklar är krypterade med valvnyckeln precis som lösenorden
+            keys = [item["key"] for entry in entries for item in _attachments_of(entry)]
+            self.metrics.add("reencrypt", len(entries) + len(keys))
+            tokens = self._map_chunks(_rekey_chunk, (self._key, new_key),
+                                      [entry.password_token for entry in entries] + keys,
+                                      workers, progress)
+            keys = iter(tokens[len(entries):])
+            rotated = []
+            for entry, token in zip(entries, tokens):
+                record = dict(entry.to_record(), password=token)
+                if "attachments" in record:
+                    record["attachments"] = [dict(item, key=next(keys))
+                                             for item in record["attachments"]]
+                rotated.append(record)
+
+            generation = self.store.stage_snapshot(rotated, self.store.snapshot_path + ".rotating")
+            keyfile.write_key_file(self.key_path + ".rotating", salt, params, new_key)
+            # Markören är commit-punkten, _recover_rotation slutför eller kastar resten
+            write_json_atomic(self.rotation_marker, {"generation": generation})
+            self._recover_rotation()
+
+            self.store.adopt_snapshot(generation)
+            for record in rotated:
+                self.table.add(Entry.from_record(record))
+            self._activate(new_key)
+
+    def _map_chunks(self, fn, args, tokens, workers=None, progress=None):
+        """fn(*args, chunk) over chunks of tokens, on a process pool for many tokens"""
+        total = len(tokens)
+        workers = workers or os.cpu_count() or 1
+        chunk_size = max(256, -(-total // (workers * 4)))
+        chunks = [tokens[i:i + chunk_size] for i in range(0, total, chunk_size)]
+
+        if workers > 1 and total >= PARALLEL_REKEY_THRESHOLD:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(fn, *([arg] * len(chunks) for arg in args), chunks)
+        else:
+            pool = None
+            results = (fn(*args, chunk) for chunk in chunks)
+
+        mapped = []
         try:
-            with open("passwords.json", "r") as f:
-                data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-            
-        for entry in data:
-            entry["password"] = self.cipher.decrypt(entry["password"].encode()).decode()
-            
-        return data
\ No newline at end of file
+            for chunk in results:
+                mapped.extend(chunk)
+                if progress is not None:
+                    progress(len(mapped), total)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return mapped
+
+    def _recover_rotation(self):
+        """Finish a committed rotation or drop the files of an unfinished one"""
+        staged = [(self.key_path + ".rotating", self.key_path),
+                  (self.store.snapshot_path + ".rotating", self.store.snapshot_path)]
+        if not os.path.exists(self.rotation_marker) and not any(
+                os.path.exists(staged_path) for staged_path, _ in staged):
+            return
+        # Filerna kan tillhöra en rotation som en annan process kör just nu
+        with self.store.lock.exclusive():
+            if os.path.exists(self.rotation_marker):
+                for staged_path, live_path in staged:
+                    if os.path.exists(staged_path):
+                        os.replace(staged_path, live_path)
+                fsync_dir(self.key_path)
+                os.remove(self.rotation_marker)
+            else:
+                for staged_path, _ in staged:
+                    if os.path.exists(staged_path):
+                        os.remove(staged_path)
+
+    def preload(self):
+        """Read the vault and build the indexes, which needs no key"""
+        return len(self._load_records())
+
+    def _load_records(self):
+        """The entry table, with what other processes wrote applied"""
+        with self._index_lock, self.store.lock.shared():
+            if self._indexed:
+                changes = self.store.refresh()
+                if changes is not None:
+                    for op in changes:
+                        self._apply_change(op)
+                    return self.table
+
+            self._recover_rotation()
+            with self.metrics.span("vault.load"):
+                table = VaultTable()
+                for record in self.store.load().values():
+                    table.add(Entry.from_record(record))
+            # Ett index som byggs under tiden ser att tabellen bytts och börjar om
+            with self._search_lock:
+                self.table = table
+                self.search_index = None
+                self._search_pending = None
+            self._indexed = True
+        return self.table
+
+    def _apply_change(self, op):
+        if op["op"] == "delete":
+            old = self.table.get(op["id"])
+            if old is not None:
+                self._drop(old)
+        elif op["op"] == "add" or op["id"] in self.table:
+            self._index(Entry.from_record(op["entry"]))
+
+    def _index(self, entry):
+        """Add an entry, or replace the one with the same id in place"""
+        old = self.table.add(entry)
+        if old is not None:
+            self.secret_cache.discard(old.password_token)
+        with self._search_lock:
+            if self.search_index is not None:
+                self.search_index.add(entry.id, entry.website, entry.username)
+            elif self._search_pending is not None:
+                self._search_pending.append(("add", entry))
+
+    def _drop(self, entry):
+        self.table.remove(entry.id)
+        self.secret_cache.discard(entry.password_token)
+        with self._search_lock:
+            if self.search_index is not None:
+                self.search_index.remove(entry.id)
+            elif self._search_pending is not None:
+                self._search_pending.append(("remove", entry))
+
+    def _maybe_compact(self):
+        if self.store.needs_compaction():
+            self.store.compact(entry.to_record() for entry in self.table)
+
+    def list_entries(self):
+        """List entries with their passwords still encrypted"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+        return [entry.to_record() for entry in self._load_records()]
+
+    def reveal_password(self, entry: dict):
+        """Decrypt the password of a single entry from list_entries"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+        token = entry["password"]
+        password = self.secret_cache.get(token)
+        if password is None:
+            self.metrics.add("decrypt")
+            password = self.cipher.decrypt(token.encode()).decode()
+            self.secret_cache.put(token, password)
+        return password
+
+    def load_passwords(self, health: bool = False):
+        """Yield decrypted copies of every entry one at a time"""
+        if not self.initialized:
+            raise RuntimeError("Encryption system not initialized")
+
+        decrypt = self.cipher.decrypt
+        count = self.metrics.add
+        if health:
+            described = self.health.describe(self._score_health()[0])
+        else:
+            described = ((entry, None) for entry in self._load_records())
+        for entry, findings in described:
+            count("decrypt")
+            record = dict(entry.to_record(), password=decrypt(entry.password_token.encode()).decode())
+            if findings is not None:
+                record["health"] = findings
+            yield record
+
+
+def _attachments_of(entry):
+    return entry.extra.get("attachments", []) if entry.extra else []
+
+
+if __name__ == "__main__":
+    import sys
+    import multiprocessing
+    # Rotationen startar processer, som i en fryst exe kör den här filen igen
+    multiprocessing.freeze_support()
+    from cli import main
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+class Metrics:
+    """Timing spans and counters for the core's hot paths
+
+    Spans aggregate count, total and max duration per name, counters are
+    plain sums. With trace_path every finished span is also appended to a
+    JSON Lines file. Safe to use from the worker threads.
+    """
+
+    enabled = True
+
+    def __init__(self, trace_path: str = None):
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._trace = open(trace_path, "a", encoding="utf-8") if trace_path else None
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name: str, start: float, end: float):
+        elapsed = end - start
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                self._spans[name] = [1, elapsed, elapsed]
+            else:
+                span[0] += 1
+                span[1] += elapsed
+                if elapsed > span[2]:
+                    span[2] = elapsed
+            if self._trace is not None:
+                self._trace.write(json.dumps({
+                    "span": name, "time": round(time.time(), 6),
+                    "ms": round(elapsed * 1000, 3), "thread": threading.current_thread().name,
+                }) + "\n")
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def stats(self):
+        """Snapshot of every span and counter so far"""
+        with self._lock:
+            if self._trace is not None:
+                self._trace.flush()
+            return {
+                "spans": {
+                    name: {"count": count, "total_ms": round(total * 1000, 3),
+                           "mean_ms": round(total * 1000 / count, 3),
+                           "max_ms": round(longest * 1000, 3)}
+                    for name, (count, total, longest) in sorted(self._spans.items())
+                },
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+_NO_SPAN = nullcontext()
+
+
+class NullMetrics(Metrics):
+    """Metrics used while instrumentation is off, records nothing"""
+
+    enabled = False
+
+    def __init__(self):
+        self.trace_path = None
+
+    def span(self, name: str):
+        return _NO_SPAN
+
+    def record(self, name: str, start: float, end: float):
+        pass
+
+    def add(self, name: str, amount: int = 1):
+        pass
+
+    def stats(self):
+        return {"spans": {}, "counters": {}}
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,116 @@
+import time
+import random
+
+# Tk-ovaler saknar alpha, så rök tonas ut genom att blanda färgen mot bakgrunden
+FADE_STEPS = 8
+
+
+def _fade(color, background, steps):
+    start = [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+    end = [int(background[i:i + 2], 16) for i in (1, 3, 5)]
+    return [
+        "#" + "".join(f"{round(s + (e - s) * step / steps):02x}" for s, e in zip(start, end))
+        for step in range(steps + 1)
+    ]
+
+
+class SmokeEngine:
+    """Fixed pool of canvas ovals rising as smoke
+
+    All ovals are created once and recycled at the bottom when they leave
+    the top, so memory stays constant however long chaos mode runs. Each
+    particle belongs to one of a few speed lanes and a whole lane moves with
+    a single canvas call per frame. Positions are tracked in Python, so the
+    canvas items are never read back. A frame that overruns the budget makes the
+    engine skip frames instead of falling behind.
+    """
+
+    LANE_SPEEDS = (4, 7, 10)
+
+    def __init__(self, canvas, colors, background, pool_size=48, size=30,
+                 frame_ms=50, budget_ms=5):
+        self.canvas = canvas
+        self.size = size
+        self.frame_ms = frame_ms
+        self.budget = budget_ms / 1000
+        self.running = False
+        self.skipped_frames = 0
+        self._after_id = None
+        self._height = 1
+
+        self.palettes = [_fade(color, background, FADE_STEPS) for color in colors]
+        self.items = []
+        self.lane = []
+        self.palette = []
+        self.y = []
+        self.fade_step = []
+        for i in range(pool_size):
+            lane = i % len(self.LANE_SPEEDS)
+            item = canvas.create_oval(0, 0, size, size, width=0, state="hidden",
+                                      tags=("smoke", f"smoke-lane{lane}"))
+            self.items.append(item)
+            self.lane.append(lane)
+            self.palette.append(0)
+            self.y.append(None)
+            self.fade_step.append(0)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        # Sprid ut starten så att röken inte stiger i ett enda block
+        self._height = max(self.canvas.winfo_height(), 1)
+        width = self.canvas.winfo_width()
+        for i in range(len(self.items)):
+            self._respawn(i, random.randint(0, self._height), width)
+        self.canvas.itemconfigure("smoke", state="normal")
+        self._after_id = self.canvas.after(self.frame_ms, self._frame)
+
+    def stop(self):
+        self.running = False
+        if self._after_id is not None:
+            self.canvas.after_cancel(self._after_id)
+            self._after_id = None
+        self.canvas.itemconfigure("smoke", state="hidden")
+
+    def _frame(self):
+        self._after_id = None
+        if not self.running:
+            return
+        started = time.perf_counter()
+
+        for lane, speed in enumerate(self.LANE_SPEEDS):
+            self.canvas.move(f"smoke-lane{lane}", 0, -speed)
+
+        width = None
+        for i in range(len(self.items)):
+            y = self.y[i] - self.LANE_SPEEDS[self.lane[i]]
+            self.y[i] = y
+            if y < -self.size:
+                if width is None:
+                    # Fönstrets storlek läses högst en gång per frame
+                    width = self.canvas.winfo_width()
+                    self._height = max(self.canvas.winfo_height(), 1)
+                self._respawn(i, self._height, width)
+                continue
+            step = min(FADE_STEPS, int((1 - y / self._height) * FADE_STEPS))
+            if step != self.fade_step[i]:
+                self.fade_step[i] = step
+                self.canvas.itemconfigure(self.items[i], fill=self.palettes[self.palette[i]][step])
+
+        # Hoppa över frames när vi ligger över budget
+        elapsed = time.perf_counter() - started
+        delay = self.frame_ms
+        if elapsed > self.budget:
+            skipped = int(elapsed / self.budget)
+            self.skipped_frames += skipped
+            delay *= 1 + skipped
+        self._after_id = self.canvas.after(delay, self._frame)
+
+    def _respawn(self, i, y, width):
+        x = random.randint(0, max(width - self.size, 0))
+        self.y[i] = y
+        self.fade_step[i] = 0
+        self.palette[i] = random.randrange(len(self.palettes))
+        self.canvas.coords(self.items[i], x, y, x + self.size, y + self.size)
+        self.canvas.itemconfigure(self.items[i], fill=self.palettes[self.palette[i]][0])
@@ -0,0 +1,193 @@
+import hmac
+import math
+import time
+import base64
+import threading
+
+# Under så här många bitar räknas ett lösenord som svagt
+WEAK_BITS = 50
+MAX_AGE_DAYS = 365
+_RATINGS = ((WEAK_BITS, "weak"), (65, "fair"), (80, "good"))
+
+_SYMBOLS = 33
+
+
+def entropy_bits(password: str):
+    """Rough entropy of a password from its character classes and length
+
+    Characters that repeat the previous one or continue a run like abc or
+    321 add nothing, so padding a short password with aaaa or 1234 does not
+    make it look strong.
+    """
+    lower = upper = digit = other = wide = False
+    effective = 0
+    previous = step = None
+    for char in password:
+        if "a" <= char <= "z":
+            lower = True
+        elif "A" <= char <= "Z":
+            upper = True
+        elif "0" <= char <= "9":
+            digit = True
+        elif char < "\x80":
+            other = True
+        else:
+            wide = True
+        code = ord(char)
+        if previous is not None:
+            diff = code - previous
+            if diff == step and -1 <= diff <= 1:
+                previous = code
+                continue
+            step = diff
+        previous = code
+        effective += 1
+    pool = 26 * lower + 26 * upper + 10 * digit + _SYMBOLS * other + 100 * wide
+    return round(effective * math.log2(pool), 1) if pool else 0.0
+
+
+def rating(bits: float):
+    for limit, name in _RATINGS:
+        if bits < limit:
+            return name
+    return "strong"
+
+
+def reuse_key(key: bytes):
+    """HMAC key for reuse digests, derived from the vault's Fernet key"""
+    return hmac.digest(base64.urlsafe_b64decode(key), b"joker password reuse", "sha256")
+
+
+def reuse_digest(key: bytes, password: str):
+    return hmac.digest(reuse_key(key), password.encode(), "sha256")
+
+
+def score_chunk(key: bytes, tokens: list):
+    """Decrypt tokens one at a time into (reuse digest, entropy bits)
+
+    Runs in pool workers, so only digests and scores ever leave the
+    process, never a plaintext.
+    """
+    from cryptography.fernet import Fernet
+    decrypt = Fernet(key).decrypt
+    mac_key = reuse_key(key)
+    scores = []
+    for token in tokens:
+        password = decrypt(token.encode())
+        scores.append((hmac.digest(mac_key, password, "sha256"),
+                       entropy_bits(password.decode())))
+    return scores
+
+
+def token_time(token):
+    """When a raw Fernet token was created, None for tokens stored as text"""
+    if type(token) is not bytes or len(token) < 9 or token[0] != 0x80:
+        return None
+    return int.from_bytes(token[1:9], "big")
+
+
+class HealthIndex:
+    """Reuse digest and entropy per entry, cached until its token changes
+
+    Every password change encrypts a new token, so an entry whose token is
+    the one scored last time needs no decryption. Reuse is found in one
+    pass by grouping the keyed digests, plaintexts are never compared.
+    The Fernet timestamp inside the token tells when the password was set.
+    """
+
+    def __init__(self):
+        self._scores = {}
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def clear(self):
+        with self._lock:
+            self._scores = {}
+            self._shared = {}
+
+    def reuse_count(self, digest: bytes):
+        """How many scored entries have the password behind digest"""
+        return self._shared.get(digest, 0)
+
+    def update(self, entries, score):
+        """Score entries that are new or changed, returns how many were
+
+        score(tokens) returns (digest, bits) for every token, see
+        score_chunk. Entries no longer in the vault are forgotten.
+        """
+        with self._lock:
+            cached = self._scores
+            fresh = {}
+            stale = []
+            for entry in entries:
+                item = cached.get(entry.id)
+                if item is not None and item[0] == entry.token:
+                    fresh[entry.id] = item
+                else:
+                    stale.append(entry)
+            if stale:
+                for entry, (digest, bits) in zip(stale, score([e.password_token for e in stale])):
+                    fresh[entry.id] = (entry.token, digest, bits, token_time(entry.token))
+            if stale or len(fresh) != len(cached):
+                shared = {}
+                for _, digest, _, _ in fresh.values():
+                    shared[digest] = shared.get(digest, 0) + 1
+                self._shared = shared
+            self._scores = fresh
+            return len(stale)
+
+    def describe(self, entries, max_age_days: int = MAX_AGE_DAYS, now: float = None):
+        """Yield (entry, health) for scored entries
+
+        health holds the entropy bits and rating, how many other entries
+        share the password, the age in days and the list of issues.
+        """
+        with self._lock:
+            scores, shared = self._scores, self._shared
+        now = time.time() if now is None else now
+        for entry in entries:
+            item = scores.get(entry.id)
+            if item is not None:
+                yield entry, _health(item, shared, now, max_age_days)
+
+    def report(self, entries, max_age_days: int = MAX_AGE_DAYS):
+        """Records without password for every entry with an issue, plus totals"""
+        with self._lock:
+            scores, shared = self._scores, self._shared
+        now = time.time()
+        cutoff = now - max_age_days * 86400
+        flagged = []
+        totals = {"reused": 0, "weak": 0, "old": 0}
+        for entry in entries:
+            item = scores.get(entry.id)
+            if item is None:
+                continue
+            # De flesta poster är friska, hoppa över dem utan att bygga något
+            _, digest, bits, created = item
+            if bits >= WEAK_BITS and shared[digest] == 1 and (created is None or created >= cutoff):
+                continue
+            health = _health(item, shared, now, max_age_days)
+            for issue in health["issues"]:
+                totals[issue] += 1
+            record = entry.to_record()
+            del record["password"]
+            record.update(health)
+            flagged.append(record)
+        return dict(totals, total=len(scores), flagged=flagged)
+
+
+def _health(item, shared, now, max_age_days):
+    _, digest, bits, created = item
+    age = int((now - created) // 86400) if created is not None else None
+    health = {"bits": bits, "rating": rating(bits), "reused": shared[digest] - 1,
+              "age_days": age, "issues": []}
+    if health["reused"]:
+        health["issues"].append("reused")
+    if bits < WEAK_BITS:
+        health["issues"].append("weak")
+    if age is not None and age > max_age_days:
+        health["issues"].append("old")
+    return health
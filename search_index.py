@@ -0,0 +1,102 @@
+from bisect import bisect_left
+
+
+class SearchIndex:
+    """Prefix and trigram index over website and username
+
+    Every entry gets a small integer sequence number. Posting lists map
+    trigrams, and the one and two character prefixes of each field keyed
+    with a leading NUL, to those numbers. They are kept sorted and exact through updates and
+    removals, so a query of up to three characters is a single posting
+    list, and a longer one only checks the candidates of its shortest
+    trigram list against the lowercased fields. Results come out in index
+    order without sorting.
+    """
+
+    def __init__(self):
+        self._seq = {}
+        # Listor indexerade med sekvensnummer, borttagna poster lämnar None och ""
+        self._ids = []
+        self._texts = []
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._seq)
+
+    def add(self, entry_id: str, website: str, username: str):
+        """Index an entry, or re-index it if its fields changed"""
+        text = f"{website.lower()}\x00{username.lower()}"
+        seq = self._seq.get(entry_id)
+        if seq is None:
+            seq = len(self._ids)
+            self._seq[entry_id] = seq
+            self._ids.append(entry_id)
+            self._texts.append(text)
+            for gram in _grams(text):
+                self._post(gram, seq)
+            return
+
+        old = self._texts[seq]
+        if old == text:
+            return
+        self._texts[seq] = text
+        old_grams, new_grams = _grams(old), _grams(text)
+        for gram in old_grams - new_grams:
+            self._unpost(gram, seq)
+        for gram in new_grams - old_grams:
+            self._post(gram, seq)
+
+    def remove(self, entry_id: str):
+        seq = self._seq.pop(entry_id, None)
+        if seq is None:
+            return
+        for gram in _grams(self._texts[seq]):
+            self._unpost(gram, seq)
+        self._ids[seq] = None
+        self._texts[seq] = ""
+
+    def search(self, query: str):
+        """Return matching entry ids in the order they were indexed
+
+        Queries shorter than three characters match the start of the website
+        or username, longer ones match anywhere in either field.
+        """
+        query = query.strip().lower()
+        if not query:
+            return list(self._seq)
+
+        ids = self._ids
+        if "\x00" in query:
+            return []
+        if len(query) <= 3:
+            # Prefixnycklarna börjar med NUL och trigrammen innehåller aldrig NUL, listan är exakt
+            key = "\x00" + query if len(query) < 3 else query
+            return [ids[seq] for seq in self._postings.get(key, ())]
+        texts = self._texts
+        lists = [self._postings.get(query[i:i + 3], ()) for i in range(len(query) - 2)]
+        return [ids[seq] for seq in min(lists, key=len) if query in texts[seq]]
+
+    def _post(self, gram, seq):
+        posting = self._postings.get(gram)
+        if posting is None:
+            self._postings[gram] = [seq]
+        elif posting[-1] < seq:
+            posting.append(seq)
+        else:
+            posting.insert(bisect_left(posting, seq), seq)
+
+    def _unpost(self, gram, seq):
+        posting = self._postings[gram]
+        del posting[bisect_left(posting, seq)]
+        if not posting:
+            del self._postings[gram]
+
+
+def _grams(text):
+    # Fälten lagras som "webbplats\0användarnamn", trigram över gränsen hoppas över
+    grams = {text[i:i + 3] for i in range(len(text) - 2)}
+    grams = {gram for gram in grams if "\x00" not in gram}
+    for field in text.split("\x00"):
+        if field:
+            grams.update(("\x00" + field[:1], "\x00" + field[:2]))
+    return grams
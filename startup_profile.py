@@ -0,0 +1,67 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    """Collect per-phase startup timings for --profile-startup"""
+
+    def __init__(self, origin: float = None, path: str = None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.path = path
+        self.phases = []
+        self._started = {}
+
+    def begin(self, name: str):
+        self._started[name] = time.perf_counter()
+
+    def end(self, name: str):
+        # Called from worker threads too, list.append is atomic
+        start = self._started.pop(name, None)
+        if start is not None:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name: str, start: float, end: float):
+        self.phases.append({
+            "phase": name,
+            "start_ms": round((start - self.origin) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        })
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def report(self):
+        """Print the phases as a table, or write them as JSON to self.path"""
+        phases = sorted(self.phases, key=lambda p: p["start_ms"])
+        total_ms = round((time.perf_counter() - self.origin) * 1000, 2)
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump({"total_ms": total_ms, "phases": phases}, f, indent=4)
+            return
+        for p in phases:
+            print(f"{p['phase']:<20} +{p['start_ms']:>9.1f} ms  {p['duration_ms']:>9.1f} ms",
+                  file=sys.stderr)
+        print(f"{'total':<20} {total_ms:>22.1f} ms", file=sys.stderr)
+
+
+class NullProfiler(StartupProfiler):
+    """Profiler used when --profile-startup is not given, records nothing"""
+
+    def begin(self, name: str):
+        pass
+
+    def end(self, name: str):
+        pass
+
+    def record(self, name: str, start: float, end: float):
+        pass
+
+    def report(self):
+        pass
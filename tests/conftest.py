@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Snabb nyckelhärledning, testerna mäter inte KDF-kostnaden
+FAST_KDF = {"kdf": "pbkdf2-sha256", "iterations": 1000}
+
+
+@pytest.fixture
+def fast_kdf():
+    return dict(FAST_KDF)
+
+
+@pytest.fixture
+def master_password():
+    return "test master password"
+
+
+@pytest.fixture
+def make_core(tmp_path):
+    """Factory for cores with a fast KDF, on tmp_path/vault unless told otherwise"""
+    pytest.importorskip("cryptography")
+    from main import PasswordManagerCore
+
+    def make(vault_dir=None, password=None):
+        core = PasswordManagerCore(dict(FAST_KDF), vault_dir=str(vault_dir or tmp_path / "vault"))
+        if password is not None:
+            if core.has_key_file():
+                core.load_encryption(password)
+            else:
+                core.initialize_encryption(password)
+        return core
+
+    return make
+
+
+@pytest.fixture
+def core(make_core, master_password):
+    """An unlocked core on a new vault in tmp_path/vault"""
+    return make_core(password=master_password)
@@ -0,0 +1,93 @@
+import os
+import socket
+import time
+import threading
+
+import pytest
+
+if not hasattr(socket, "AF_UNIX"):
+    pytest.skip("the agent needs Unix domain sockets", allow_module_level=True)
+pytest.importorskip("cryptography")
+
+from agent import (AgentClient, UnlockAgent, default_socket_path, socket_dir, start_agent_thread,
+                   vault_identity)
+def _wait_for(path):
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_socket_dir_is_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    path = socket_dir()
+    assert path == str(tmp_path / "joker")
+    assert os.stat(path).st_mode & 0o777 == 0o700
+
+    os.chmod(path, 0o755)
+    with pytest.raises(RuntimeError):
+        socket_dir()
+
+
+def test_second_agent_refuses_a_live_socket(core, tmp_path):
+    path = str(tmp_path / "agent.sock")
+    agent = start_agent_thread(core, path)
+    try:
+        _wait_for(path)
+        with pytest.raises(RuntimeError):
+            UnlockAgent(core, path)
+        with AgentClient(path) as client:
+            assert client.connect()
+            assert client.request("ping") == vault_identity(core.vault_dir)
+    finally:
+        agent.stop()
+
+
+def test_stale_socket_is_replaced(core, tmp_path):
+    path = str(tmp_path / "agent.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    agent = UnlockAgent(core, path)
+    assert not os.path.exists(path)
+    agent.stop()
+
+
+def test_ping_names_the_vault(core, tmp_path):
+    path = str(tmp_path / "agent.sock")
+    agent = start_agent_thread(core, path)
+    try:
+        _wait_for(path)
+        with AgentClient(path) as client:
+            assert client.connect()
+            assert client.request("ping") == vault_identity(core.vault_dir)
+    finally:
+        agent.stop()
+
+
+def test_each_vault_gets_its_own_socket(tmp_path, monkeypatch):
+    monkeypatch.delenv("JOKER_AGENT_SOCK", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert default_socket_path("vaults/team") != default_socket_path()
+    assert default_socket_path(None) == default_socket_path(os.curdir)
+
+
+def test_agent_stops_after_rotation_elsewhere(core, make_core, master_password, tmp_path):
+    path = str(tmp_path / "agent.sock")
+    agent = UnlockAgent(core, path)
+    thread = threading.Thread(target=agent.serve_forever)
+    thread.start()
+    try:
+        _wait_for(path)
+        other = make_core(core.vault_dir, password=master_password)
+        other.rotate_master_password(master_password, "a brand new password")
+        with AgentClient(path) as client:
+            assert client.connect()
+            with pytest.raises(RuntimeError):
+                client.request("list")
+    finally:
+        agent.stop()
+        thread.join(5)
+    assert not thread.is_alive()
+    assert not core.initialized
@@ -0,0 +1,153 @@
+import os
+import random
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.exceptions import InvalidTag
+
+import attachments
+from attachments import write_blob, save_blob, blob_path, BlobReader, prune
+SECRET = bytes(range(32))
+CHUNK = 64
+
+
+def _file(tmp_path, data, name="source.bin"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 3 * CHUNK + 5])
+def test_chunked_round_trip(tmp_path, size):
+    data = random.Random(size).randbytes(size)
+    blobs = str(tmp_path / "blobs")
+    progress = []
+    key, address, written = write_blob(blobs, SECRET, _file(tmp_path, data), chunk_size=CHUNK,
+                                       progress=lambda done, total: progress.append(done))
+    assert written == size
+    assert progress[-1] == size
+    assert os.path.getsize(blob_path(blobs, address)) == (
+        attachments._HEADER.size + size + max(1, -(-size // CHUNK)) * attachments.TAG_SIZE)
+
+    target = str(tmp_path / "out.bin")
+    save_blob(blobs, address, key, target)
+    with open(target, "rb") as f:
+        assert f.read() == data
+
+    # Samma innehåll ger samma blob, och den skrivs inte om
+    again = write_blob(blobs, SECRET, _file(tmp_path, data, "copy.bin"), chunk_size=CHUNK)
+    assert again == (key, address, size)
+
+
+def test_read_across_chunk_boundaries(tmp_path):
+    data = random.Random(1).randbytes(5 * CHUNK + 17)
+    blobs = str(tmp_path / "blobs")
+    key, address, _ = write_blob(blobs, SECRET, _file(tmp_path, data), chunk_size=CHUNK)
+
+    with BlobReader(blob_path(blobs, address), key) as reader:
+        assert len(reader) == len(data)
+        assert reader.chunk_count == 6
+        for offset in (0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 2 * CHUNK - 3, len(data) - 1):
+            for size in (1, 2, CHUNK - 1, CHUNK, CHUNK + 1, 3 * CHUNK, len(data)):
+                assert reader.read(offset, size) == data[offset:offset + size]
+        assert reader.read() == data
+        assert reader.read(len(data), 10) == b""
+        assert reader.read(len(data) + 5) == b""
+        with pytest.raises(IndexError):
+            reader.read_chunk(6)
+
+
+@pytest.mark.parametrize("cut", [1, attachments.TAG_SIZE, attachments.TAG_SIZE + 17])
+def test_truncated_blob_is_detected(tmp_path, cut):
+    data = random.Random(2).randbytes(3 * CHUNK + 17)
+    blobs = str(tmp_path / "blobs")
+    key, address, _ = write_blob(blobs, SECRET, _file(tmp_path, data), chunk_size=CHUNK)
+    path = blob_path(blobs, address)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - cut)
+
+    with BlobReader(path, key) as reader:
+        assert reader.read(0, CHUNK) == data[:CHUNK]
+        with pytest.raises(ValueError, match="truncated"):
+            reader.read(len(data) - 1, 1)
+
+    target = str(tmp_path / "out.bin")
+    with pytest.raises(ValueError, match="truncated"):
+        save_blob(blobs, address, key, target)
+    assert not os.path.exists(target)
+    assert not os.path.exists(target + ".tmp")
+
+
+def test_whole_chunks_cut_off_are_detected(tmp_path):
+    data = random.Random(3).randbytes(3 * CHUNK)
+    blobs = str(tmp_path / "blobs")
+    key, address, _ = write_blob(blobs, SECRET, _file(tmp_path, data), chunk_size=CHUNK)
+    path = blob_path(blobs, address)
+    with open(path, "r+b") as f:
+        f.truncate(attachments._HEADER.size + 2 * (CHUNK + attachments.TAG_SIZE))
+
+    with BlobReader(path, key) as reader:
+        with pytest.raises(ValueError, match="truncated"):
+            list(reader)
+
+
+def test_tampered_chunk_fails_authentication(tmp_path):
+    data = random.Random(4).randbytes(2 * CHUNK)
+    blobs = str(tmp_path / "blobs")
+    key, address, _ = write_blob(blobs, SECRET, _file(tmp_path, data), chunk_size=CHUNK)
+    path = blob_path(blobs, address)
+    with open(path, "r+b") as f:
+        f.seek(attachments._HEADER.size + CHUNK + attachments.TAG_SIZE + 3)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 1]))
+
+    with BlobReader(path, key) as reader:
+        assert reader.read_chunk(0) == data[:CHUNK]
+        with pytest.raises(InvalidTag):
+            reader.read_chunk(1)
+
+
+def test_prune_keeps_referenced_and_temporary_files(tmp_path):
+    blobs = str(tmp_path / "blobs")
+    _, kept, _ = write_blob(blobs, SECRET, _file(tmp_path, b"kept", "a.bin"))
+    _, dropped, _ = write_blob(blobs, SECRET, _file(tmp_path, b"dropped", "b.bin"))
+    partial = blob_path(blobs, dropped) + ".123.tmp"
+    open(partial, "wb").close()
+
+    assert prune(blobs, {kept}) == 1
+    assert os.path.exists(blob_path(blobs, kept))
+    assert not os.path.exists(blob_path(blobs, dropped))
+    assert os.path.exists(partial)
+    assert prune(str(tmp_path / "missing"), set()) == 0
+
+
+def test_prune_then_attach_again(core, tmp_path):
+    first = core.save_password_entry({"website": "a.example", "username": "a", "password": "x"})
+    second = core.save_password_entry({"website": "b.example", "username": "b", "password": "y"})
+    data = random.Random(5).randbytes(200_000)
+    source = _file(tmp_path, data)
+
+    shared = core.attach_file(first, source, name="doc.bin")
+    assert core.attach_file(second, source, name="doc.bin")["blob"] == shared["blob"]
+    path = blob_path(core.attachments_path, shared["blob"])
+
+    # Bloben delas, så den ligger kvar tills ingen post pekar på den
+    core.detach_file(first, "doc.bin")
+    assert os.path.exists(path)
+    core.detach_file(second, "doc.bin")
+    assert not os.path.exists(path)
+    assert core.attachments(second) == []
+    assert core.prune_attachments() == 0
+
+    assert core.attach_file(first, source, name="doc.bin") == shared
+    assert os.path.exists(path)
+    with core.open_attachment(first, "doc.bin") as reader:
+        assert reader.read(attachments.CHUNK_SIZE - 10, 20) == \
+            data[attachments.CHUNK_SIZE - 10:attachments.CHUNK_SIZE + 10]
+    target = str(tmp_path / "saved.bin")
+    core.save_attachment(first, "doc.bin", target)
+    with open(target, "rb") as f:
+        assert f.read() == data
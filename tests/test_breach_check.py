@@ -0,0 +1,88 @@
+import random
+import hashlib
+
+import pytest
+
+import breach_check
+from breach_check import build_index, BreachIndex
+
+
+def _hashes(count, seed=3):
+    rng = random.Random(seed)
+    counts = {}
+    # Första och sista prefixet i fan-out-tabellen ska vara med
+    counts[bytes(2) + rng.randbytes(18)] = 5
+    counts[b"\xff\xff" + rng.randbytes(18)] = 6
+    while len(counts) < count:
+        counts[rng.randbytes(20)] = rng.randrange(1, 100_000)
+    return counts
+
+
+def _write_source(path, counts, order):
+    with open(path, "w") as f:
+        for digest in order:
+            f.write(f"{digest.hex().upper()}:{counts[digest]}\r\n")
+
+
+def _check(path, counts):
+    with BreachIndex(path) as index:
+        assert len(index) == len(counts)
+        for digest, count in counts.items():
+            assert index.lookup(digest) == count
+        missing = hashlib.sha1(b"not in the list").digest()
+        assert missing not in counts
+        assert index.lookup(missing) == 0
+        assert index.lookup(bytes(20)) == 0
+        assert index.lookup(b"\xff" * 20) == 0
+
+
+@pytest.mark.parametrize("run_size", [1, 97, 1000, 5000])
+def test_shuffled_input_is_merged_across_runs(tmp_path, run_size):
+    counts = _hashes(2000)
+    order = list(counts)
+    random.Random(run_size).shuffle(order)
+    source = tmp_path / "hashes.txt"
+    _write_source(source, counts, order)
+
+    runs = []
+    total = build_index(str(source), str(tmp_path / "breach.idx"), run_size=run_size,
+                        progress=lambda count, _: runs.append(count))
+    assert total == len(counts)
+    assert len(runs) == -(-len(counts) // run_size)
+    _check(str(tmp_path / "breach.idx"), counts)
+
+
+def test_sorted_input_is_concatenated(tmp_path, monkeypatch):
+    def no_merge(*streams):
+        raise AssertionError("sorted input should not be merged")
+
+    monkeypatch.setattr(breach_check.heapq, "merge", no_merge)
+    counts = _hashes(2000, seed=11)
+    source = tmp_path / "hashes.txt"
+    _write_source(source, counts, sorted(counts))
+
+    assert build_index(str(source), str(tmp_path / "breach.idx"), run_size=300) == len(counts)
+    _check(str(tmp_path / "breach.idx"), counts)
+
+
+def test_count_password_and_empty_list(tmp_path):
+    source = tmp_path / "hashes.txt"
+    digest = hashlib.sha1(b"hunter2").digest()
+    source.write_text(f"{digest.hex()}:17\n\nnot a hash line\n")
+    build_index(str(source), str(tmp_path / "breach.idx"))
+    with BreachIndex(str(tmp_path / "breach.idx")) as index:
+        assert index.count_password("hunter2") == 17
+        assert index.count_password("hunter3") == 0
+
+    (tmp_path / "empty.txt").write_text("")
+    assert build_index(str(tmp_path / "empty.txt"), str(tmp_path / "empty.idx")) == 0
+    with BreachIndex(str(tmp_path / "empty.idx")) as index:
+        assert len(index) == 0
+        assert index.count_password("hunter2") == 0
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / "not.idx"
+    path.write_bytes(b"\0" * 4096)
+    with pytest.raises(ValueError):
+        BreachIndex(str(path))
@@ -0,0 +1,22 @@
+import pytest
+
+import bulk_io
+
+
+def _failing_entries():
+    yield {"website": "a.example", "username": "a", "password": "plaintext"}
+    raise RuntimeError("decryption failed")
+
+
+def test_failed_export_leaves_no_plaintext(tmp_path):
+    path = str(tmp_path / "export.jsonl")
+    with pytest.raises(RuntimeError):
+        bulk_io.write_entries(path, _failing_entries())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_round_trips(tmp_path):
+    path = str(tmp_path / "export.csv")
+    entries = [{"website": "a.example", "username": "a", "password": "p,1"}]
+    assert bulk_io.write_entries(path, entries) == 1
+    assert list(bulk_io.read_entries(path)) == entries
@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+import cli
+from agent import start_agent_thread
+from vault_set import VaultSet
+
+PASSWORD = "cli test password"
+
+
+@pytest.fixture
+def vaults(tmp_path, monkeypatch, fast_kdf):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(cli.PASSWORD_ENV, PASSWORD)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.delenv("JOKER_AGENT_SOCK", raising=False)
+    vault_set = VaultSet(kdf_params=fast_kdf)
+    for name in ("default", "team"):
+        core = vault_set.create(name, PASSWORD)
+        core.save_password_entry({"website": "mail.example", "username": f"{name}-user",
+                                  "password": f"{name} secret"})
+    return vault_set
+
+
+def _lines(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_get_across_all_vaults(vaults, capsys):
+    assert cli.main(["--json", "--all-vaults", "get", "mail.example"]) == 0
+    assert sorted((line["vault"], line["password"]) for line in _lines(capsys)) == [
+        ("default", "default secret"), ("team", "team secret")]
+
+
+def test_search_in_chosen_vaults(vaults, capsys):
+    assert cli.main(["--json", "--vault", "team", "--vault", "default", "search", "mail"]) == 0
+    assert sorted(line["vault"] for line in _lines(capsys)) == ["default", "team"]
+
+
+def test_add_refuses_several_vaults(vaults, capsys):
+    assert cli.main(["--all-vaults", "add", "x.example", "x", "-p", "pw"]) == 1
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="the agent needs Unix domain sockets")
+def test_agent_of_another_vault_is_not_used(vaults, capsys, tmp_path, monkeypatch):
+    team = vaults.core("team")
+    path = str(tmp_path / "team.sock")
+    agent = start_agent_thread(team, path)
+    try:
+        deadline = time.monotonic() + 5
+        while not os.path.exists(path):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert cli.main(["--json", "--socket", path, "add", "new.example", "me", "-p", "pw"]) == 0
+    finally:
+        agent.stop()
+    capsys.readouterr()
+    assert team.find("new.example") == []
+    assert cli.main(["--json", "--no-agent", "get", "new.example"]) == 0
+    assert [line["password"] for line in _lines(capsys)] == ["pw"]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="the agent needs Unix domain sockets")
+def test_locked_agent_falls_back_to_local_unlock(vaults, capsys, tmp_path, monkeypatch, make_core):
+    path = str(tmp_path / "default.sock")
+    agent = start_agent_thread(vaults.core("default"), path)
+    try:
+        deadline = time.monotonic() + 5
+        while not os.path.exists(path):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        # Lösenordsbytet i en annan process gör att agenten låser sig vid nästa fråga
+        rotated = "a rotated master password"
+        make_core(tmp_path, password=PASSWORD).rotate_master_password(PASSWORD, rotated)
+        monkeypatch.setenv(cli.PASSWORD_ENV, rotated)
+        assert cli.main(["--json", "--socket", path, "get", "mail.example"]) == 0
+    finally:
+        agent.stop()
+    assert [line["password"] for line in _lines(capsys)] == ["default secret"]
+
+
+def test_bench_needs_entries(capsys):
+    assert cli.main(["bench", "-n", "0"]) == 1
+    assert "at least one entry" in capsys.readouterr().err
+
+
+def test_prompt_without_terminal_is_an_error(vaults, capsys, monkeypatch):
+    termios = pytest.importorskip("termios")
+    import getpass
+
+    def no_terminal(*args, **kwargs):
+        raise termios.error(25, "Inappropriate ioctl for device")
+
+    monkeypatch.delenv(cli.PASSWORD_ENV)
+    monkeypatch.setattr(getpass, "getpass", no_terminal)
+    assert cli.main(["--no-agent", "list"]) == 1
+    assert cli.PASSWORD_ENV in capsys.readouterr().err
+
+
+def test_undecryptable_entry_is_an_error(vaults, capsys, monkeypatch):
+    from cryptography.fernet import InvalidToken
+    import main
+
+    def damaged(self, entry):
+        raise InvalidToken
+
+    monkeypatch.setattr(main.PasswordManagerCore, "reveal_password", damaged)
+    assert cli.main(["--no-agent", "get", "mail.example"]) == 1
+    assert "could not be decrypted" in capsys.readouterr().err
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+import keyfile
+from main import PasswordManagerCore
+
+
+def _config(tmp_path, monkeypatch, kdf):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config.json").write_text(json.dumps({"salt": "kept", "kdf": kdf}))
+
+
+def test_config_picks_fixed_parameters(tmp_path, monkeypatch):
+    params = {"kdf": "scrypt", "n": 2 ** 14, "r": 8, "p": 1}
+    _config(tmp_path, monkeypatch, {"params": params})
+    assert PasswordManagerCore().calibrate_kdf() == params
+
+
+def test_config_refuses_parameters_below_the_minimum(tmp_path, monkeypatch):
+    _config(tmp_path, monkeypatch, {"params": {"kdf": "pbkdf2-sha256", "iterations": 1000}})
+    with pytest.raises(ValueError):
+        keyfile.kdf_settings()
+
+
+def test_config_sets_calibration_target(tmp_path, monkeypatch):
+    _config(tmp_path, monkeypatch, {"target_seconds": 0.01, "algorithm": "scrypt"})
+    params = PasswordManagerCore().calibrate_kdf()
+    assert params["kdf"] == "scrypt"
+    assert params["n"] == keyfile.MINIMUM_COST["scrypt"]["n"]
+
+
+def test_save_keeps_the_rest_of_the_config(tmp_path, monkeypatch):
+    _config(tmp_path, monkeypatch, {})
+    keyfile.main(["0.25", "--algorithm", "scrypt", "--save"])
+    config = json.loads((tmp_path / "config.json").read_text())
+    assert config == {"salt": "kept", "kdf": {"target_seconds": 0.25, "algorithm": "scrypt"}}
+    assert keyfile.kdf_settings() == {"target_seconds": 0.25, "algorithm": "scrypt"}
+
+
+def test_header_round_trips(tmp_path):
+    path = str(tmp_path / "encryption.key")
+    salt = bytes(range(16))
+    params = {"kdf": "pbkdf2-sha256", "iterations": 1000}
+    key = keyfile.derive_key("round trip password", salt, params)
+    keyfile.write_key_file(path, salt, params, key)
+
+    read_salt, read_params, check = keyfile.read_key_file(path)
+    assert read_salt == salt
+    assert read_params == dict(params, version=keyfile.VERSION)
+    assert check(key)
+    assert not check(keyfile.derive_key("another password!", salt, params))
+
+
+def test_legacy_key_file_unlocks_and_is_rewritten(tmp_path):
+    path = tmp_path / "encryption.key"
+    salt = b"0123456789abcdef"
+    key = keyfile.derive_key("legacy master password", salt, dict(keyfile.DEFAULT_KDF))
+    # Före headern låg saltet och själva nyckeln rakt i filen
+    path.write_bytes(salt + key)
+
+    core = PasswordManagerCore(vault_dir=str(tmp_path))
+    core.load_encryption("legacy master password")
+    assert core.initialized
+    data = path.read_bytes()
+    assert data.startswith(keyfile.MAGIC)
+    assert key not in data
+
+    read_salt, params, check = keyfile.read_key_file(str(path))
+    assert read_salt == salt
+    assert params == dict(keyfile.DEFAULT_KDF, version=keyfile.VERSION)
+    assert check(key)
+    core.lock()
+    core.load_encryption("legacy master password")
+
+
+def test_legacy_key_file_refuses_a_wrong_password(tmp_path):
+    from cryptography.exceptions import InvalidKey
+
+    path = tmp_path / "encryption.key"
+    salt = b"0123456789abcdef"
+    path.write_bytes(salt + keyfile.derive_key("legacy master password", salt, dict(keyfile.DEFAULT_KDF)))
+    with pytest.raises(InvalidKey):
+        PasswordManagerCore(vault_dir=str(tmp_path)).load_encryption("not the password")
+    assert not path.read_bytes().startswith(keyfile.MAGIC)
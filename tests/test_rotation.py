@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("cryptography")
+
+from main import KeyChangedError
+
+OLD = "old master password"
+NEW = "new master password"
+
+
+def _entry(n):
+    return {"website": f"site{n}.example", "username": f"user{n}", "password": f"secret {n}"}
+
+
+def test_write_after_rotation_elsewhere_is_refused(make_core):
+    stale = make_core(password=OLD)
+    stale.save_password_entry(_entry(1))
+
+    rotating = make_core(password=OLD)
+    rotating.rotate_master_password(OLD, NEW)
+
+    with pytest.raises(KeyChangedError):
+        stale.save_password_entry(_entry(2))
+    assert not stale.initialized
+    assert not stale.key_is_current()
+
+    fresh = make_core(password=NEW)
+    entries = fresh.find()
+    assert [entry["username"] for entry in entries] == ["user1"]
+    assert fresh.reveal_password(entries[0]) == "secret 1"
+
+
+def test_key_stays_current_without_rotation(make_core):
+    core = make_core(password=OLD)
+    other = make_core(password=OLD)
+    other.save_password_entry(_entry(1))
+
+    core.save_password_entry(_entry(2))
+    assert core.key_is_current()
+    assert len(core.find()) == 2
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+
+def test_search_survives_reloads_on_other_threads(core, make_core):
+    core.apply_changes([("add", {"website": f"site{i}.example", "username": f"user{i}",
+                                 "password": "x"}) for i in range(200)])
+    other = make_core(core.vault_dir)
+    stop = threading.Event()
+    tables = []
+
+    def reload():
+        while not stop.is_set():
+            # En komprimering i en annan kärna byter snapshot, så nästa läsning laddar om allt
+            other.store.compact()
+            core.preload()
+            tables.append(core.table)
+
+    thread = threading.Thread(target=reload)
+    thread.start()
+    try:
+        for _ in range(300):
+            assert len(core.search("site1")) == 111
+    finally:
+        stop.set()
+        thread.join()
+    assert len({id(table) for table in tables}) > 1
+
+
+def test_changes_during_an_index_build_are_not_lost(core, monkeypatch):
+    import main
+    core.save_password_entry({"website": "old.example", "username": "a", "password": "x"})
+    building = threading.Event()
+    release = threading.Event()
+
+    class SlowIndex(main.SearchIndex):
+        def add(self, *args):
+            if not building.is_set():
+                building.set()
+                release.wait(5)
+            super().add(*args)
+
+    monkeypatch.setattr(main, "SearchIndex", SlowIndex)
+    thread = core.warm_search_index_async()
+    assert building.wait(5)
+    assert core.search("new", wait=False) is None
+    core.save_password_entry({"website": "new.example", "username": "b", "password": "x"})
+    release.set()
+    thread.join(5)
+    assert len(core.search("example")) == 2
+    assert len(core.search("new")) == 1
@@ -0,0 +1,49 @@
+import random
+
+from search_index import SearchIndex
+
+
+def _expected(entries, query):
+    query = query.strip().lower()
+    found = []
+    for entry_id, (website, username) in entries.items():
+        fields = (website.lower(), username.lower())
+        if len(query) < 3:
+            match = any(field.startswith(query) for field in fields)
+        else:
+            match = any(query in field for field in fields)
+        if match:
+            found.append(entry_id)
+    return found
+
+
+def test_matches_a_scan_through_adds_updates_and_removes():
+    rng = random.Random(7)
+    index = SearchIndex()
+    entries = {}
+    for step in range(3000):
+        entry_id = str(rng.randrange(200))
+        if entry_id in entries and rng.random() < 0.2:
+            index.remove(entry_id)
+            del entries[entry_id]
+        else:
+            # ^ är med för att prefixnycklar och trigram inte ska kunna blandas ihop
+            website = "".join(rng.choice("ab^C") for _ in range(rng.randrange(6)))
+            username = "".join(rng.choice("ab^C") for _ in range(rng.randrange(5)))
+            index.add(entry_id, website, username)
+            entries[entry_id] = (website, username)
+        if step % 50 == 0:
+            for query in ("a", "ab", "^", "^a", "abc", "^ab", "a^b", "abca", "c", "Ab"):
+                found = index.search(query)
+                assert sorted(found) == sorted(_expected(entries, query)), query
+
+
+def test_results_keep_index_order_after_updates():
+    index = SearchIndex()
+    for i in range(50):
+        index.add(str(i), f"site{i}.example", f"user{i}")
+    index.add("10", "renamed.example", "user10")
+    index.remove("20")
+    assert index.search("example") == [str(i) for i in range(50) if i != 20]
+    assert index.search("s") == [str(i) for i in range(50) if i not in (10, 20)]
+    assert index.search("ren") == ["10"]
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from main import SecretCache
+
+
+def test_expired_secrets_are_dropped_without_being_asked_for():
+    cache = SecretCache(ttl=0.05)
+    cache.put("token", "secret")
+    assert cache.get("token") == "secret"
+    deadline = time.monotonic() + 5
+    while cache._items:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_goes_first():
+    cache = SecretCache(maxsize=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+    cache.clear()
+
+
+def test_discard_races_with_get():
+    cache = SecretCache(maxsize=8)
+    stop = threading.Event()
+
+    def discard():
+        while not stop.is_set():
+            for i in range(8):
+                cache.discard(str(i))
+
+    thread = threading.Thread(target=discard)
+    thread.start()
+    try:
+        for _ in range(20000):
+            for i in range(8):
+                cache.put(str(i), "x")
+                cache.get(str(i))
+    finally:
+        stop.set()
+        thread.join()
+    cache.clear()
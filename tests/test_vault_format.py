@@ -0,0 +1,46 @@
+import base64
+
+import pytest
+
+import vault_format
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / "passwords.vault")
+    token = base64.urlsafe_b64encode(b"\x80" + bytes(range(60))).decode()
+    records = [
+        {"id": "a", "website": "a.example", "username": "å", "password": token, "rev": 3},
+        {"id": "b", "website": "b.example", "username": "b", "password": "abcd+/efgh", "rev": 1},
+        {"id": "c", "website": "c.example", "username": "c", "password": token, "rev": 2,
+         "attachments": [{"name": "x.txt", "size": 1, "blob": "ab", "key": "k"}]},
+    ]
+    vault_format.write_vault(path, 7, records)
+    assert vault_format.read_vault(path) == (7, records)
+
+
+def test_empty_vault(tmp_path):
+    path = str(tmp_path / "passwords.vault")
+    vault_format.write_vault(path, 1, [])
+    assert vault_format.read_vault(path) == (1, [])
+
+
+def test_tokens_that_are_not_base64_are_kept_as_text(tmp_path):
+    path = str(tmp_path / "passwords.vault")
+    records = [{"id": str(i), "website": "w", "username": "u", "password": token, "rev": 1}
+               for i, token in enumerate(("abc", "plain password", "abcd+/efgh", ""))]
+    vault_format.write_vault(path, 1, records)
+    assert vault_format.read_vault(path) == (1, records)
+
+
+def test_any_record_by_index(tmp_path):
+    path = str(tmp_path / "passwords.vault")
+    token = base64.urlsafe_b64encode(bytes(57)).decode()
+    records = [{"id": f"{i:04}", "website": f"site{i}", "username": "u", "password": token, "rev": 1}
+               for i in range(100)]
+    vault_format.write_vault(path, 1, records)
+    with vault_format.VaultFile(path) as vault:
+        assert len(vault) == 100
+        assert vault.record(57) == records[57]
+        assert vault.record(99) == records[99]
+        with pytest.raises(IndexError):
+            vault.record(100)
@@ -0,0 +1,133 @@
+import os
+import json
+import threading
+import multiprocessing
+
+import pytest
+
+from vault_store import FileLock, JournalStore
+
+fcntl = pytest.importorskip("fcntl")
+
+
+def _other_process_can_lock(path, exclusive):
+    # A separate open file description conflicts like another process would
+    fd = os.open(path, os.O_RDWR)
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
+def test_reader_leaving_first_keeps_writer_exclusive(tmp_path):
+    lock = FileLock(str(tmp_path / "vault.lock"))
+    reader_in, writer_in, reader_out, writer_out = (threading.Event() for _ in range(4))
+
+    def reader():
+        with lock.shared():
+            reader_in.set()
+            writer_in.wait()
+        reader_out.set()
+
+    def writer():
+        reader_in.wait()
+        with lock.exclusive():
+            writer_in.set()
+            writer_out.wait()
+
+    threads = [threading.Thread(target=reader), threading.Thread(target=writer)]
+    for thread in threads:
+        thread.start()
+    reader_out.wait(5)
+    try:
+        assert not _other_process_can_lock(lock.path, exclusive=False)
+    finally:
+        writer_out.set()
+        for thread in threads:
+            thread.join(5)
+    assert _other_process_can_lock(lock.path, exclusive=True)
+
+
+def test_writer_leaving_first_downgrades_to_shared(tmp_path):
+    lock = FileLock(str(tmp_path / "vault.lock"))
+    with lock.shared():
+        with lock.exclusive():
+            assert not _other_process_can_lock(lock.path, exclusive=False)
+        assert _other_process_can_lock(lock.path, exclusive=False)
+        assert not _other_process_can_lock(lock.path, exclusive=True)
+    assert _other_process_can_lock(lock.path, exclusive=True)
+
+
+def _hold_exclusive(path, held, release):
+    lock = FileLock(path)
+    with lock.exclusive():
+        held.set()
+        release.wait(10)
+
+
+def test_exclusive_lock_excludes_other_processes(tmp_path):
+    path = str(tmp_path / "vault.lock")
+    held, release = multiprocessing.Event(), multiprocessing.Event()
+    child = multiprocessing.Process(target=_hold_exclusive, args=(path, held, release))
+    child.start()
+    try:
+        assert held.wait(10)
+        assert not _other_process_can_lock(path, exclusive=False)
+    finally:
+        release.set()
+        child.join(10)
+    assert _other_process_can_lock(path, exclusive=True)
+
+
+def _store(directory):
+    return JournalStore(os.path.join(directory, "passwords.json"),
+                        os.path.join(directory, "passwords.journal"))
+
+
+def _record(i):
+    return {"id": f"id{i}", "website": "example.com", "username": f"user{i}", "password": "x"}
+
+
+def test_torn_tail_is_dropped_and_later_appends_survive(tmp_path):
+    store = _store(str(tmp_path))
+    store.load()
+    store.add(_record(1))
+    store.add(_record(2))
+    with open(store.journal_path, "ab") as f:
+        f.write(b'{"op": "add", "entry": {"id": "torn"')
+
+    reader = _store(str(tmp_path))
+    assert list(reader.load()) == ["id1", "id2"]
+    reader.add(_record(3))
+    assert list(_store(str(tmp_path)).load()) == ["id1", "id2", "id3"]
+    with open(store.journal_path, "rb") as f:
+        assert all(json.loads(line) for line in f)
+
+
+def _append_many(directory, worker, count):
+    store = _store(directory)
+    store.compact_threshold = 25
+    for i in range(count):
+        # Som kärnan: läs in det andra processer skrivit under skrivlåset
+        with store.lock.exclusive():
+            if store.refresh() is None:
+                store.load()
+            store.add(_record(f"{worker}-{i}"))
+            if store.needs_compaction():
+                store.compact()
+
+
+def test_appends_from_several_processes_are_all_kept(tmp_path):
+    directory = str(tmp_path)
+    _store(directory).load()
+    workers = [multiprocessing.Process(target=_append_many, args=(directory, worker, 40))
+               for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    assert len(_store(directory).load()) == 160
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from vault_store import ConflictError
+from write_queue import BackgroundWriter
+
+def _entry(n):
+    return {"website": f"site{n}.example", "username": f"user{n}", "password": f"secret {n}"}
+
+
+@pytest.fixture
+def core(core, monkeypatch):
+    core.calls = []
+    core.batches = []
+    apply_changes, write_batch = core.apply_changes, core.store.write_batch
+
+    def spy_apply(changes):
+        core.calls.append(list(changes))
+        return apply_changes(changes)
+
+    def spy_write(ops):
+        core.batches.append(len(ops))
+        return write_batch(ops)
+
+    monkeypatch.setattr(core, "apply_changes", spy_apply)
+    monkeypatch.setattr(core.store, "write_batch", spy_write)
+    return core
+
+
+class _Commits(list):
+    """on_commit that records each batch, it runs after flush() has returned"""
+
+    def __init__(self):
+        super().__init__()
+        self.event = threading.Event()
+
+    def __call__(self, count, error):
+        self.append((count, error))
+        self.event.set()
+
+    def wait(self):
+        assert self.event.wait(10)
+        return self
+
+
+def test_burst_is_one_apply_changes(core):
+    commits = _Commits()
+    writer = BackgroundWriter(core, window=30, on_commit=commits)
+    futures = [writer.add(_entry(n)) for n in range(25)]
+    # Fönstret är långt, det är flushen som skickar iväg skuren
+    assert writer.flush(timeout=10)
+
+    assert len(core.calls) == 1 and len(core.calls[0]) == 25
+    assert core.batches == [25]
+    assert commits.wait() == [(25, None)]
+    ids = [future.result(timeout=0) for future in futures]
+    assert len(set(ids)) == 25
+    assert sorted(entry["username"] for entry in core.find()) == sorted(f"user{n}" for n in range(25))
+    writer.close()
+
+
+def test_max_batch_splits_a_burst(core):
+    writer = BackgroundWriter(core, window=30, max_batch=4)
+    futures = [writer.add(_entry(n)) for n in range(10)]
+    assert writer.close(timeout=10)
+    assert [len(call) for call in core.calls] == [4, 4, 2]
+    assert all(future.done() for future in futures)
+
+
+def test_rejected_change_fails_only_its_own_future(core):
+    existing = core.save_password_entry(_entry(0))
+    writer = BackgroundWriter(core, window=30)
+    added = writer.add(_entry(1))
+    missing = writer.update("no such id", password="x")
+    stale = writer.delete(existing, expected_rev=7)
+    unknown = writer.update(existing, colour="blue")
+    updated = writer.update(existing, password="changed", expected_rev=1)
+    assert writer.close(timeout=10)
+
+    assert len(core.calls) == 1
+    assert core.batches == [2]
+    with pytest.raises(KeyError):
+        missing.result(timeout=0)
+    with pytest.raises(ConflictError):
+        stale.result(timeout=0)
+    with pytest.raises(ValueError):
+        unknown.result(timeout=0)
+    assert updated.result(timeout=0) is None
+    new_id = added.result(timeout=0)
+    assert core.get(new_id)["username"] == "user1"
+    entry = core.get(existing)
+    assert entry["rev"] == 2
+    assert core.reveal_password(entry) == "changed"
+
+
+def test_failed_commit_fails_the_whole_batch(core, monkeypatch):
+    def broken(ops):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(core.store, "write_batch", broken)
+    commits = _Commits()
+    writer = BackgroundWriter(core, window=30, on_commit=commits)
+    futures = [writer.add(_entry(n)) for n in range(3)]
+    assert writer.close(timeout=10)
+    for future in futures:
+        with pytest.raises(OSError):
+            future.result(timeout=0)
+    assert len(commits.wait()) == 1 and isinstance(commits[0][1], OSError)
+    assert core.find() == []
+
+
+def test_close_flushes_and_refuses_later_submits(core):
+    commits = _Commits()
+    writer = BackgroundWriter(core, window=30, on_commit=commits)
+    futures = [writer.add(_entry(n)) for n in range(5)]
+    assert writer.pending == 5
+    assert writer.close(timeout=10)
+
+    assert commits.wait() == [(5, None)]
+    assert writer.pending == 0
+    assert all(future.done() and future.exception() is None for future in futures)
+    assert len(core.find()) == 5
+    with pytest.raises(RuntimeError):
+        writer.add(_entry(6))
+    with pytest.raises(RuntimeError):
+        writer.delete(futures[0].result())
+    assert len(core.calls) == 1
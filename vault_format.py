@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import mmap
+import base64
+import struct
+import binascii
+
+# Header: magic, format version, snapshot generation, record count. Then a
+# table with the absolute offset of every record, then the records, each a
+# uint32 length followed by the fields below
+MAGIC = b"JVLT"
+VERSION = 1
+_HEADER = struct.Struct(">4sB3xQI")
+_OFFSET = struct.Struct(">Q")
+_LENGTH = struct.Struct(">I")
+# rev, token kind, length of the text fields and of the extra fields. The
+# text fields are id, website and username joined by NUL, so one decode and
+# one split read all three. The token follows them, then any extra fields
+_FIELDS = struct.Struct(">IBHI")
+
+# Fernet-tokens lagras som råa bytes, en fjärdedel mindre än base64-texten
+TOKEN_RAW = 0
+TOKEN_TEXT = 1
+
+_KNOWN = ("id", "website", "username", "password", "rev")
+
+
+def is_vault_file(path: str):
+    return path.endswith(".vault")
+
+
+def encode_record(record: dict):
+    text = (record["id"], record["website"], record["username"])
+    if any("\x00" in field for field in text):
+        raise ValueError("Vault fields cannot contain NUL characters")
+    text = "\x00".join(text).encode()
+
+    token = record["password"]
+    try:
+        raw = base64.urlsafe_b64decode(token)
+    except (binascii.Error, ValueError):
+        # Inte base64 alls, lagras som text precis som Entry.from_record gör
+        raw = None
+    if raw is not None and base64.urlsafe_b64encode(raw).decode() == token:
+        kind, token_bytes = TOKEN_RAW, raw
+    else:
+        kind, token_bytes = TOKEN_TEXT, token.encode()
+    extra = {key: value for key, value in record.items() if key not in _KNOWN}
+    extra = json.dumps(extra, separators=(",", ":")).encode() if extra else b""
+    return b"".join((_FIELDS.pack(record.get("rev", 0), kind, len(text), len(extra)),
+                     text, token_bytes, extra))
+
+
+def decode_record(buffer, start: int, end: int):
+    """Decode the record stored in buffer[start:end]"""
+    rev, kind, text_len, extra_len = _FIELDS.unpack_from(buffer, start)
+    start += _FIELDS.size
+    entry_id, website, username = str(buffer[start:start + text_len], "utf-8").split("\x00")
+    token = buffer[start + text_len:end - extra_len]
+    token = base64.urlsafe_b64encode(token) if kind == TOKEN_RAW else bytes(token)
+
+    record = {"id": entry_id, "website": website, "username": username,
+              "password": token.decode()}
+    if rev:
+        record["rev"] = rev
+    if extra_len:
+        record.update(json.loads(bytes(buffer[end - extra_len:end])))
+    return record
+
+
+def write_vault(path: str, generation: int, records):
+    """Write records to a binary vault file, replacing path atomically"""
+    from vault_store import fsync_dir
+
+    payloads = [encode_record(record) for record in records]
+    offsets = []
+    position = _HEADER.size + _OFFSET.size * len(payloads)
+    for payload in payloads:
+        offsets.append(position)
+        position += _LENGTH.size + len(payload)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, generation, len(payloads)))
+        f.write(b"".join(_OFFSET.pack(offset) for offset in offsets))
+        f.write(b"".join(_LENGTH.pack(len(payload)) + payload for payload in payloads))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+
+class VaultFile:
+    """Memory-mapped binary vault with constant time access to any record
+
+    Opening only reads the header. record(i) finds its record through the
+    offset table and decodes just that record, and iterating decodes
+    straight from the mapping without copying the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap kan inte mappa en tom fil
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f"{path} is not a vault file")
+        magic, version, self.generation, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a vault file")
+        if version > VERSION:
+            raise ValueError(f"{path} needs a newer version of Joker Encryption")
+        self._view = memoryview(self._map)
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index: int):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        (offset,) = _OFFSET.unpack_from(self._map, _HEADER.size + index * _OFFSET.size)
+        (length,) = _LENGTH.unpack_from(self._map, offset)
+        start = offset + _LENGTH.size
+        return decode_record(self._view, start, start + length)
+
+    def __iter__(self):
+        # Samma avkodning som decode_record, inlinad eftersom den körs per post
+        view = self._view
+        unpack_length = _LENGTH.unpack_from
+        unpack_fields = _FIELDS.unpack_from
+        encode_token = base64.urlsafe_b64encode
+        fields_end = _LENGTH.size + _FIELDS.size
+        for offset in struct.unpack_from(f">{self.count}Q", self._map, _HEADER.size):
+            (length,) = unpack_length(view, offset)
+            rev, kind, text_len, extra_len = unpack_fields(view, offset + _LENGTH.size)
+            start = offset + fields_end
+            end = offset + _LENGTH.size + length
+            if kind != TOKEN_RAW or extra_len:
+                yield decode_record(view, offset + _LENGTH.size, end)
+                continue
+            entry_id, website, username = str(view[start:start + text_len], "utf-8").split("\x00")
+            record = {"id": entry_id, "website": website, "username": username,
+                      "password": encode_token(view[start + text_len:end]).decode()}
+            if rev:
+                record["rev"] = rev
+            yield record
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_vault(path: str):
+    """Generation and records of a binary vault file"""
+    with VaultFile(path) as vault:
+        return vault.generation, list(vault)
+
+
+def convert(json_path: str = "passwords.json", vault_path: str = "passwords.vault"):
+    """Convert a JSON snapshot to the binary format, keeping its generation
+
+    The journal stays valid because the generation does not change. Run it
+    with no other Joker process open, they would keep using the JSON file.
+    """
+    from vault_store import JournalStore
+
+    store = JournalStore(json_path)
+    with store.lock.exclusive():
+        entries = store._read_snapshot()
+        records = {}
+        for entry in entries:
+            store._assign_legacy_id(entry, records)
+            records[entry["id"]] = entry
+        generation = store.generation
+        write_vault(vault_path, generation, records.values())
+        if os.path.exists(json_path):
+            os.replace(json_path, json_path + ".bak")
+    return len(records)
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "passwords.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".vault"
+    count = convert(source, target)
+    print(f"Converted {count} entries to {target}, the old file is {source}.bak")
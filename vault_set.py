@@ -0,0 +1,114 @@
+import os
+import re
+
+import keyfile
+from main import PasswordManagerCore
+
+VAULTS_DIR = "vaults"
+# Valvet i arbetskatalogen, som fanns innan valv fick namn
+DEFAULT_VAULT = "default"
+_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*\Z")
+
+
+class VaultSet:
+    """Named vaults, each a PasswordManagerCore with its own key file and store
+
+    Vaults live in root/<name>, and the vault in the working directory is
+    the one called default. Several vaults unlock together with their key
+    derivations running in parallel on a process pool, and search and find
+    fan out over every unlocked vault.
+    """
+
+    def __init__(self, root: str = VAULTS_DIR, kdf_params: dict = None):
+        self.root = root
+        self.kdf_params = kdf_params
+        self._cores = {}
+
+    def path(self, name: str):
+        if name == DEFAULT_VAULT:
+            return None
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid vault name: {name}")
+        return os.path.join(self.root, name)
+
+    def names(self):
+        """Every vault that has a key file, default first"""
+        names = [DEFAULT_VAULT] if self.core(DEFAULT_VAULT).has_key_file() else []
+        try:
+            found = sorted(os.listdir(self.root))
+        except FileNotFoundError:
+            found = []
+        return names + [name for name in found if name != DEFAULT_VAULT and _NAME.match(name)
+                        and os.path.exists(os.path.join(self.root, name, "encryption.key"))]
+
+    def core(self, name: str):
+        core = self._cores.get(name)
+        if core is None:
+            core = PasswordManagerCore(self.kdf_params, vault_dir=self.path(name))
+            self._cores[name] = core
+        return core
+
+    def create(self, name: str, master_password: str):
+        """Set up a new vault, raises ValueError if it already exists"""
+        core = self.core(name)
+        if core.has_key_file():
+            raise ValueError(f"Vault {name} already exists")
+        core.initialize_encryption(master_password)
+        return core
+
+    def unlock(self, passwords: dict, workers: int = None):
+        """Unlock vaults from a dict of name to master password
+
+        Keys are derived on a process pool, one vault per worker, so
+        unlocking several vaults takes about as long as the slowest one.
+        Returns the vaults that failed, by name, with their exception.
+        """
+        from cryptography.exceptions import InvalidKey
+
+        failed = {}
+        headers = {}
+        for name, password in passwords.items():
+            try:
+                headers[name] = self.core(name).key_header()
+            except (RuntimeError, ValueError) as e:
+                failed[name] = e
+
+        workers = min(len(headers), workers or os.cpu_count() or 1)
+        pool = None
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=workers)
+            keys = {name: pool.submit(keyfile.derive_key, passwords[name], salt, params)
+                    for name, (salt, params) in headers.items()}
+        try:
+            for name in headers:
+                try:
+                    key = keys[name].result() if pool is not None else None
+                    self.core(name).load_encryption(passwords[name], key)
+                except (InvalidKey, RuntimeError, ValueError) as e:
+                    failed[name] = e
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return failed
+
+    def unlocked(self):
+        """(name, core) of every unlocked vault, in name order"""
+        return [(name, core) for name, core in sorted(self._cores.items()) if core.initialized]
+
+    def search(self, query: str):
+        """(vault, id) of entries matching query in every unlocked vault"""
+        return [(name, entry_id) for name, core in self.unlocked() for entry_id in core.search(query)]
+
+    def find(self, website: str = None, username: str = None):
+        """Entries from every unlocked vault, each with its vault name under "vault" """
+        return [dict(record, vault=name) for name, core in self.unlocked()
+                for record in core.find(website, username)]
+
+    def warm_search_indexes(self):
+        """Build the search index of every unlocked vault on daemon threads"""
+        return [core.warm_search_index_async() for _, core in self.unlocked()]
+
+    def lock(self):
+        for core in self._cores.values():
+            core.lock()
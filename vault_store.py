@@ -0,0 +1,397 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+import vault_format
+from metrics import NullMetrics
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class ConflictError(RuntimeError):
+    """The vault changed on disk since it was read"""
+
+
+class FileLock:
+    """Advisory lock on a sidecar file, shared for readers and exclusive for writers
+
+    Locks are re-entrant within the process: a shared request while any
+    thread holds the lock is free, and an exclusive request upgrades it
+    until the last exclusive holder leaves. Windows has no shared byte
+    range locks, so there every holder takes the exclusive lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+        self._holders = []
+        self._exclusive = False
+        self._mutex = threading.Lock()
+
+    @contextmanager
+    def shared(self):
+        mode = self._acquire(False)
+        try:
+            yield
+        finally:
+            self._release(mode)
+
+    @contextmanager
+    def exclusive(self):
+        mode = self._acquire(True)
+        try:
+            yield
+        finally:
+            self._release(mode)
+
+    def _acquire(self, exclusive):
+        exclusive = exclusive or os.name == "nt"
+        with self._mutex:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if not self._holders or (exclusive and not self._exclusive):
+                self._lock(exclusive)
+                self._exclusive = exclusive
+            self._holders.append(exclusive)
+        return exclusive
+
+    def _release(self, exclusive):
+        with self._mutex:
+            # Hållarna släpper i valfri ordning mellan trådar, ta bort just sin egen
+            self._holders.remove(exclusive)
+            if not self._holders:
+                self._unlock()
+                self._exclusive = False
+            elif self._exclusive and True not in self._holders:
+                # Sista skrivaren lämnar, läsarna behåller ett delat lås
+                self._lock(False)
+                self._exclusive = False
+
+    def _lock(self, exclusive):
+        if os.name == "nt":
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                    return
+                except OSError:
+                    # LK_LOCK ger upp efter tio sekunder, fortsätt vänta
+                    continue
+        fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _unlock(self):
+        if os.name == "nt":
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class JournalStore:
+    """Snapshot file plus append-only journal of vault records
+
+    Saves append one JSON line to the journal and fsync it, so their cost does
+    not depend on the vault size. Once the journal holds enough records it is
+    folded into a new snapshot. Every journal record carries the snapshot
+    generation it belongs to, which makes compaction crash-safe: after the new
+    snapshot is renamed into place, leftover records of the old generation are
+    ignored on replay.
+
+    Several processes may share a vault. Readers hold lock.shared() and
+    writers lock.exclusive(), and refresh() picks up what other processes
+    appended since the last read. The snapshot identity and the journal
+    length act as the version of what this process has seen, and appending
+    on top of a stale version raises ConflictError instead of losing data.
+    """
+
+    COMPACT_THRESHOLD = 1000
+
+    def __init__(self, snapshot_path="passwords.json", journal_path="passwords.journal",
+                 compact_threshold=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_threshold = compact_threshold or self.COMPACT_THRESHOLD
+        self.lock = FileLock(os.path.splitext(snapshot_path)[0] + ".lock")
+        self.generation = 0
+        self.journal_records = 0
+        self.loaded = False
+        self._open_txns = set()
+        self._pending = {}
+        self._snapshot_stat = None
+        self._journal_offset = 0
+        # Threads of this process must never replay their own appends
+        self._io_lock = threading.RLock()
+        self.metrics = NullMetrics()
+
+    def load(self):
+        """Replay snapshot and journal into an ordered dict of records by id"""
+        with self._io_lock:
+            return self._load()
+
+    def _load(self):
+        self._snapshot_stat = _stat(self.snapshot_path)
+        records = {}
+        with self.metrics.span("snapshot.read"):
+            entries = self._read_snapshot()
+        if self._snapshot_stat is not None:
+            self.metrics.add("bytes.read", self._snapshot_stat[1])
+        for entry in entries:
+            self._assign_legacy_id(entry, records)
+            records[entry["id"]] = entry
+
+        self.journal_records = 0
+        self._pending = {}
+        self._journal_offset = 0
+        with self.metrics.span("journal.read"):
+            ops = [op for op in self._read_journal() if op.get("gen") == self.generation]
+        for op in self._replay(ops):
+            self._apply(records, op)
+        self.loaded = True
+        return records
+
+    def is_current(self):
+        """Whether nothing was written since the last load or refresh"""
+        with self._io_lock:
+            return self._journal_size() == self._journal_offset and \
+                _stat(self.snapshot_path) == self._snapshot_stat
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def refresh(self):
+        """Ops other processes appended since the last load or refresh
+
+        Returns None when the snapshot was replaced, by a compaction or a
+        rotation, and the vault has to be loaded again.
+        """
+        with self._io_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        if not self.loaded:
+            return None
+        if _stat(self.snapshot_path) != self._snapshot_stat:
+            return None
+        size = self._journal_size()
+        if size == self._journal_offset:
+            return []
+        if size < self._journal_offset:
+            return None
+
+        with self.metrics.span("journal.read"):
+            ops = self._read_journal()
+        if any(op.get("gen") != self.generation for op in ops):
+            return None
+        return list(self._replay(ops))
+
+    def _replay(self, ops):
+        """Yield the ops that take effect, holding back uncommitted transactions"""
+        for op in ops:
+            self.journal_records += 1
+            if op["op"] == "commit":
+                yield from self._pending.pop(op["txn"], ())
+            elif "txn" in op:
+                # Transaktioner utan commit-post syns aldrig
+                self._pending.setdefault(op["txn"], []).append(op)
+            else:
+                yield op
+
+    def _apply(self, records, op):
+        if op["op"] == "add":
+            self._assign_legacy_id(op["entry"], records)
+            records[op["entry"]["id"]] = op["entry"]
+        elif op["op"] == "update" and op["id"] in records:
+            records[op["id"]] = op["entry"]
+        elif op["op"] == "delete":
+            records.pop(op["id"], None)
+
+    def add(self, entry: dict):
+        """Durably append a new record to the journal"""
+        self._append({"op": "add", "entry": entry})
+
+    def update(self, entry_id: str, entry: dict):
+        """Durably replace the record with the given id"""
+        self._append({"op": "update", "id": entry_id, "entry": entry})
+
+    def delete(self, entry_id: str):
+        """Durably remove the record with the given id"""
+        self._append({"op": "delete", "id": entry_id})
+
+    def add_batch(self, entries, txn: str):
+        """Append records of an uncommitted transaction without syncing"""
+        self._open_txns.add(txn)
+        self._append(*({"op": "add", "entry": entry, "txn": txn} for entry in entries), sync=False)
+
+    def commit(self, txn: str):
+        """Make every record of txn visible with a single fsync"""
+        self._append({"op": "commit", "txn": txn})
+        self._open_txns.discard(txn)
+
+    def write_batch(self, ops):
+        """Durably append add, update and delete ops as one transaction
+
+        The ops and their commit record go out in a single write and fsync,
+        and a crash before the commit record is on disk drops all of them.
+        """
+        txn = os.urandom(8).hex()
+        self._append(*(dict(op, txn=txn) for op in ops), {"op": "commit", "txn": txn})
+
+    def abort(self, txn: str):
+        """Give up on txn, its records stay invisible and vanish on compaction"""
+        self._open_txns.discard(txn)
+
+    def _append(self, *ops, sync=True):
+        with self.lock.exclusive(), self._io_lock:
+            if not self.loaded:
+                # Generation must be known before writing
+                self._load()
+            elif not self.is_current():
+                raise ConflictError("The vault was changed by another process")
+            self._write_journal(ops, sync)
+
+    def needs_compaction(self):
+        # Compaction would drop the records of a transaction still being written
+        return not self._open_txns and self.journal_records >= self.compact_threshold
+
+    def compact(self, records=None):
+        """Fold the journal into a new snapshot generation of the given records"""
+        with self.lock.exclusive(), self._io_lock:
+            if records is None:
+                records = self._load().values()
+            elif not self.is_current():
+                raise ConflictError("The vault was changed by another process")
+            generation = self.stage_snapshot(records, self.snapshot_path)
+            self.adopt_snapshot(generation)
+
+    def stage_snapshot(self, records, path: str):
+        """Write records as the next generation to path, to be renamed in later"""
+        generation = self.generation + 1
+        with self.metrics.span("snapshot.write"):
+            if vault_format.is_vault_file(self.snapshot_path):
+                vault_format.write_vault(path, generation, records)
+            else:
+                write_json_atomic(path, {"generation": generation, "entries": list(records)})
+        self.metrics.add("bytes.written", os.path.getsize(path))
+        return generation
+
+    def adopt_snapshot(self, generation: int):
+        """Switch to a snapshot generation that has been renamed into place"""
+        with self._io_lock:
+            self.generation = generation
+            self._snapshot_stat = _stat(self.snapshot_path)
+            # Records of the old generation are now ignored, truncating is cleanup
+            with open(self.journal_path, "wb") as f:
+                os.fsync(f.fileno())
+            self.journal_records = 0
+            self._journal_offset = 0
+            self._pending = {}
+
+    @staticmethod
+    def _assign_legacy_id(entry, records):
+        # Records written before ids existed get one from their position,
+        # which stays stable until the next compaction persists it
+        if "id" not in entry:
+            entry["id"] = f"legacy-{len(records)}"
+
+    def _read_snapshot(self):
+        if vault_format.is_vault_file(self.snapshot_path):
+            try:
+                self.generation, entries = vault_format.read_vault(self.snapshot_path)
+            except FileNotFoundError:
+                self.generation, entries = 0, []
+            return entries
+
+        try:
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = []
+
+        # Äldre valv är en ren lista utan generation
+        if isinstance(data, list):
+            self.generation = 0
+            return data
+        self.generation = data.get("generation", 0)
+        return data.get("entries", [])
+
+    def _read_journal(self):
+        """Parse the journal from where the last read stopped"""
+        valid_end = self._journal_offset
+        ops = []
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(valid_end)
+                for line in f:
+                    # A line without newline is a torn write from a crash
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    valid_end += len(line)
+                    ops.append(op)
+                size = f.seek(0, os.SEEK_END)
+            self.metrics.add("bytes.read", valid_end - self._journal_offset)
+        except FileNotFoundError:
+            return ops
+
+        if size > valid_end:
+            # Drop the torn tail so later appends start on a clean line
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(valid_end)
+                os.fsync(f.fileno())
+        self._journal_offset = valid_end
+        return ops
+
+    def _write_journal(self, ops, sync=True):
+        payload = b"".join(
+            json.dumps(dict(op, gen=self.generation), separators=(",", ":")).encode() + b"\n"
+            for op in ops
+        )
+        with self.metrics.span("journal.write"), open(self.journal_path, "ab") as f:
+            f.write(payload)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+                self.metrics.add("fsyncs")
+        self.metrics.add("bytes.written", len(payload))
+        self.journal_records += len(ops)
+        self._journal_offset += len(payload)
+
+
+def _stat(path):
+    """Identity of a file that changes whenever it is replaced by a rename"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file, fsync it and rename it over path"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+
+def fsync_dir(path):
+    """Persist a rename on filesystems that need the directory synced"""
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
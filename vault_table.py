@@ -0,0 +1,129 @@
+import sys
+import base64
+import binascii
+
+
+class Entry:
+    """One vault entry, the password only as its encrypted Fernet token
+
+    Tokens are kept as raw bytes, see vault_format.py, and entries never
+    hold plaintext. to_record() gives the dict form that the store and the
+    public PasswordManagerCore methods use.
+    """
+
+    __slots__ = ("id", "website", "username", "token", "rev", "extra")
+
+    def __init__(self, entry_id, website, username, token, rev=0, extra=None):
+        self.id = entry_id
+        self.website = website
+        self.username = username
+        self.token = token
+        self.rev = rev
+        self.extra = extra
+
+    @classmethod
+    def from_record(cls, record: dict):
+        token = record["password"]
+        try:
+            raw = _decode_token(token)
+        except ValueError:
+            # Allt som inte är base64 sparas som text
+            raw = token
+        rev = record.get("rev", 0)
+        extra = None
+        if len(record) > (5 if "rev" in record else 4):
+            extra = {key: value for key, value in record.items() if key not in _RECORD_FIELDS}
+        return cls(record["id"], sys.intern(record["website"]), record["username"], raw,
+                   rev, extra)
+
+    @property
+    def password_token(self):
+        """The Fernet token as text, as stored in records"""
+        token = self.token
+        if type(token) is str:
+            return token
+        return base64.urlsafe_b64encode(token).decode()
+
+    def to_record(self):
+        record = {"id": self.id, "website": self.website, "username": self.username,
+                  "password": self.password_token}
+        if self.rev:
+            record["rev"] = self.rev
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+
+_RECORD_FIELDS = ("id", "website", "username", "password", "rev")
+
+
+def _decode_token(token: str):
+    if len(token) % 4:
+        raise ValueError("Not a Fernet token")
+    return binascii.a2b_base64(token.replace("-", "+").replace("_", "/"), strict_mode=True)
+
+
+class VaultTable:
+    """Entries by id in insertion order, indexed by website
+
+    The website index maps to the entry itself while a website has a single
+    account and to a list once it has more, which is the common case for a
+    password vault and saves a container per entry. Lookups by account
+    filter the website's entries by username.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._by_website = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._rows
+
+    def __iter__(self):
+        return iter(list(self._rows.values()))
+
+    def get(self, entry_id: str):
+        return self._rows.get(entry_id)
+
+    def add(self, entry: Entry):
+        """Add an entry, or replace the one with its id without moving it"""
+        old = self._rows.get(entry.id)
+        if old is not None:
+            self._unindex(old)
+        self._rows[entry.id] = entry
+        bucket = self._by_website.get(entry.website)
+        if bucket is None:
+            self._by_website[entry.website] = entry
+        elif type(bucket) is list:
+            bucket.append(entry)
+        else:
+            self._by_website[entry.website] = [bucket, entry]
+        return old
+
+    def remove(self, entry_id: str):
+        entry = self._rows.pop(entry_id)
+        self._unindex(entry)
+        return entry
+
+    def find(self, website: str = None, username: str = None):
+        """Entries for a website, optionally only one account"""
+        if website is None:
+            entries = self._rows.values()
+        else:
+            bucket = self._by_website.get(website, ())
+            entries = bucket if type(bucket) in (list, tuple) else (bucket,)
+        if username is None:
+            return list(entries)
+        return [entry for entry in entries if entry.username == username]
+
+    def _unindex(self, entry):
+        bucket = self._by_website[entry.website]
+        if type(bucket) is not list:
+            del self._by_website[entry.website]
+            return
+        bucket.remove(entry)
+        if len(bucket) == 1:
+            self._by_website[entry.website] = bucket[0]
@@ -0,0 +1,185 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualTreeview:
+    """Treeview that only materializes the rows that fit on screen
+
+    Row values live in a plain dict keyed by entry id, and the widget only
+    holds the current window of rows, so inserting, removing and scrolling
+    cost the same for ten entries as for a hundred thousand. Widget item ids
+    are the entry ids, which keeps selection() and identify_row() usable
+    like on a normal Treeview.
+    """
+
+    def __init__(self, parent, columns, headings, widths):
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", selectmode="browse")
+        for column, heading, width in zip(columns, headings, widths):
+            self.tree.heading(column, text=heading, anchor=tk.W)
+            self.tree.column(column, width=width)
+
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.yview)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.rows = {}
+        self.order = []
+        # Raderna som visas, samma lista som order när inget filter är aktivt
+        self.view = self.order
+        self.offset = 0
+        self.visible = 20
+        self.selected = None
+        self._rendering = False
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda e: self.scroll(1, "pages"))
+
+    def set_rows(self, rows):
+        """Replace all rows with (entry_id, values) pairs"""
+        self.rows = dict(rows)
+        self.order = list(self.rows)
+        self.view = self.order
+        self.offset = 0
+        if self.selected not in self.rows:
+            self.selected = None
+        self._render()
+
+    def insert_row(self, entry_id, values):
+        """Add one row at the end, or update it in place if it exists"""
+        if entry_id in self.rows:
+            self.rows[entry_id] = values
+            if self.tree.exists(entry_id):
+                self.tree.item(entry_id, values=values)
+            return
+
+        self.rows[entry_id] = values
+        self.order.append(entry_id)
+        if self.view is not self.order:
+            # Filtered views are refreshed by whoever owns the filter
+            return
+        if len(self.view) <= self.offset + self.visible:
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def remove_row(self, entry_id):
+        if self.rows.pop(entry_id, None) is None:
+            return
+        if self.view is not self.order:
+            self.order.remove(entry_id)
+            if entry_id not in self.view:
+                return
+        position = self.view.index(entry_id)
+        del self.view[position]
+        if self.selected == entry_id:
+            self.selected = None
+
+        if position < self.offset:
+            # Behåll samma rader i fönstret
+            self.offset -= 1
+            self._update_scrollbar()
+        elif position < self.offset + self.visible:
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def set_filter(self, entry_ids):
+        """Show only entry_ids in the given order, or every row for None"""
+        if entry_ids is None:
+            self.view = self.order
+        else:
+            self.view = [entry_id for entry_id in entry_ids if entry_id in self.rows]
+        self.offset = 0
+        self._render()
+
+    def yview(self, *args):
+        """Scrollbar command, scrolls the row window instead of the widget"""
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self.view)))
+        elif args[0] == "scroll":
+            self.scroll(int(args[1]), args[2])
+
+    def scroll(self, amount, what="units"):
+        step = self.visible if what == "pages" else 1
+        self._scroll_to(self.offset + amount * step)
+
+    def selection(self):
+        return (self.selected,) if self.selected is not None else ()
+
+    def selection_set(self, entry_id):
+        self.selected = entry_id
+        self.tree.selection_set(entry_id)
+
+    def identify_row(self, y):
+        return self.tree.identify_row(y)
+
+    def bind(self, sequence, func):
+        self.tree.bind(sequence, func, add="+")
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.view) - self.visible))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _render(self):
+        self.offset = max(0, min(self.offset, len(self.view) - self.visible))
+        window = self.view[self.offset:self.offset + self.visible]
+
+        # Undertryck <<TreeviewSelect>> medan fönstret byggs om
+        self._rendering = True
+        self.tree.delete(*self.tree.get_children())
+        for entry_id in window:
+            self.tree.insert("", tk.END, iid=entry_id, values=self.rows[entry_id])
+        if self.selected in self.tree.get_children():
+            self.tree.selection_set(self.selected)
+        self.tree.after_idle(self._end_render)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = len(self.view)
+        if total:
+            shown = min(self.visible, total - self.offset)
+            self.scrollbar.set(self.offset / total, (self.offset + shown) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _end_render(self):
+        self._rendering = False
+
+    def _on_select(self, event):
+        if self._rendering:
+            return
+        selection = self.tree.selection()
+        self.selected = selection[0] if selection else None
+
+    def _on_resize(self, event):
+        style = ttk.Style()
+        row_height = int(style.lookup("Treeview", "rowheight") or 20)
+        # En rad går åt till rubrikerna
+        visible = max(1, event.height // row_height - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self._render()
+
+    def _move_selection(self, step):
+        """Keyboard navigation that scrolls past the edge of the window"""
+        if self.selected not in self.view:
+            return
+        position = self.view.index(self.selected) + step
+        if not 0 <= position < len(self.view):
+            return "break"
+        self.selected = self.view[position]
+        if not self.offset <= position < self.offset + self.visible:
+            self._scroll_to(position - (0 if step < 0 else self.visible - 1))
+        if self.tree.exists(self.selected):
+            self.tree.selection_set(self.selected)
+            self.tree.focus(self.selected)
+        return "break"
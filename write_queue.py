@@ -0,0 +1,119 @@
+import time
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+
+class BackgroundWriter:
+    """Queue of vault changes, committed in bursts on a writer thread
+
+    submit() returns a Future at once. The writer waits up to window
+    seconds after the first change of a burst for more to arrive and hands
+    them all to core.apply_changes, so a burst of edits costs a single
+    fsync. on_commit(count, error) runs on the writer thread after every
+    batch. Queued changes are flushed by close(), which also runs when the
+    interpreter exits.
+    """
+
+    def __init__(self, core, window: float = 0.05, max_batch: int = 500, on_commit=None):
+        self.core = core
+        self.window = window
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self._queue = deque()
+        self._in_flight = 0
+        self._flushing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        atexit.register(self.close)
+
+    @property
+    def pending(self):
+        """Changes queued or being written"""
+        with self._cond:
+            return len(self._queue) + self._in_flight
+
+    def submit(self, *change):
+        """Queue a change as apply_changes takes it, returns a Future of its result"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The writer is closed")
+            self._queue.append((change, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="vault-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return future
+
+    def add(self, entry: dict):
+        return self.submit("add", entry)
+
+    def update(self, entry_id: str, **fields):
+        return self.submit("update", entry_id, fields)
+
+    def delete(self, entry_id: str, expected_rev: int = None):
+        return self.submit("delete", entry_id, {"expected_rev": expected_rev})
+
+    def flush(self, timeout: float = None):
+        """Commit everything queued now, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._queue or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout: float = None):
+        """Flush and stop the writer, later submits raise RuntimeError"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        done = self.flush(timeout)
+        atexit.unregister(self.close)
+        return done
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    if self._closed:
+                        self._thread = None
+                        return
+                    self._cond.wait()
+                # Vänta in resten av skuren, om ingen väntar på en flush
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch and not self._flushing and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                self._in_flight = len(batch)
+
+            error = None
+            try:
+                results = self.core.apply_changes([change for change, _ in batch])
+            except Exception as e:
+                error = e
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+            if self.on_commit is not None:
+                self.on_commit(len(batch), error)